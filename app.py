@@ -3,30 +3,66 @@
 #----------------------------------------------------------------------------#
 
 import json
+import functools
 import dateutil.parser
 import babel
 from flask import (Flask, render_template, request,
-  Response, flash, redirect, url_for, jsonify, abort
+  Response, flash, redirect, url_for, jsonify, abort, stream_with_context, send_from_directory
 )
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.ext.associationproxy import association_proxy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
-from datetime import datetime
-import re
+from pagination import keyset_paginate, encode_cursor
+import search
+import query_plans
+import importer
+import exporter
+from cache import PageCache, FragmentCache, add_tags, conditional
+from metrics import RequestMetrics
+from profiler import RequestProfiler
+import config
+import db_pool
+import partitions
+import bookings
+from replicas import ReplicaRouter, RoutingSession
+from counters import ShowCounters
+from versions import LISTINGS, ListingVersions
+from jobs import JobQueue
+from typeahead import PrefixIndex, prefix_query
+from view_models import ShowTile, VenueShow, ArtistShow, VenuePage, ArtistPage, detail_page
+import click
+from datetime import datetime, timedelta, timezone
 import sys
+import itertools
+import signal
+import threading
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config.from_object(config.profile())
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+  db_pool.engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI']))
+app.config['SQLALCHEMY_BINDS'] = {key: dict(db_pool.engine_options(app.config, url), url=url)
+  for key, url in app.config['SQLALCHEMY_BINDS'].items()}
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+with app.app_context():
+  for engine in db.engines.values():
+    db_pool.sqlite_foreign_keys(engine)
+replica_router = RoutingSession.router = ReplicaRouter(app, db)
 migrate = Migrate(app, db)
+page_cache = PageCache(app)
+fragment_cache = FragmentCache(app)
+request_metrics = RequestMetrics(app)
+profiler = RequestProfiler(app)
 
 # TODO==: connect to a local postgresql database
 
@@ -36,14 +72,35 @@ migrate = Migrate(app, db)
 
 class Show(db.Model):
   __tablename__ = 'shows'
-
-  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), primary_key=True)
-  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), primary_key=True)
+  __table_args__ = (
+    # every hot query filters or sorts shows by start_time
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_shows_start_time', 'start_time', 'venue_id', 'artist_id'),
+    # monthly partitions on PostgreSQL, see partitions.py
+    {'postgresql_partition_by': 'RANGE (start_time)'},
+  )
+
+  # deleting a venue or artist deletes its shows in the database
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True)
+  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True)
   start_time = db.Column(db.DateTime, primary_key=True)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+    server_default=db.func.current_timestamp())
+  venue = db.relationship('Venue', backref=db.backref('shows', lazy=True, order_by='Show.start_time',
+    passive_deletes=True), overlaps='artists,venues')
+  artist = db.relationship('Artist', backref=db.backref('shows', lazy=True, order_by='Show.start_time',
+    passive_deletes=True), overlaps='artists,venues')
 
   def __repr__(self):
     return f'<Show venue_id: {self.venue_id}, artist_id: {self.artist_id}, start_time: {self.start_time}>'
 
+@event.listens_for(Show.__table__, 'after_create')
+def create_show_partitions(target, connection, **kw):
+  if connection.dialect.name == 'postgresql':
+    partitions.create_default(connection)
+    partitions.ensure_partitions(connection)
+
 class Venue(db.Model):
     __tablename__ = 'venues'
 
@@ -55,11 +112,19 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.String(120), nullable=False)
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(700))
-    artists = db.relationship('Artist', secondary='shows', backref=db.backref('venues', lazy=True))
+    # maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+      server_default=db.func.current_timestamp())
+    artists = db.relationship('Artist', secondary='shows', backref=db.backref('venues', lazy=True, overlaps='shows',
+      passive_deletes=True), overlaps='shows,venue,artist', passive_deletes=True)
+    genre_links = db.relationship('VenueGenre', cascade='all, delete-orphan',
+      passive_deletes=True)
+    genres = association_proxy('genre_links', 'genre', creator=lambda genre: VenueGenre(genre=genre))
 
     def __repr__(self):
       return f'<Venue id: {self.id}, name: {self.name}>'
@@ -74,12 +139,19 @@ class Artist(db.Model):
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(700))
+    # maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+      server_default=db.func.current_timestamp())
+    genre_links = db.relationship('ArtistGenre', cascade='all, delete-orphan',
+      passive_deletes=True)
+    genres = association_proxy('genre_links', 'genre', creator=lambda genre: ArtistGenre(genre=genre))
 
     def __repr__(self):
       return f'<Artist id: {self.id}, name: {self.name}>'
@@ -87,22 +159,446 @@ class Artist(db.Model):
   
     # TODO==: implement any missing fields, as a database migration using Flask-Migrate
 
+class MusicGenre(db.Model):
+  # one row per value of forms.Genre, plus any legacy genre found in the data
+  __tablename__ = 'genres'
+
+  name = db.Column(db.String(50), primary_key=True)
+
+  def __repr__(self):
+    return f'<MusicGenre name: {self.name}>'
+
+@event.listens_for(MusicGenre.__table__, 'after_create')
+def seed_genres(target, connection, **kw):
+  connection.execute(target.insert(), [{'name': genre.value} for genre in Genre])
+
+class VenueGenre(db.Model):
+  __tablename__ = 'venue_genres'
+  __table_args__ = (db.Index('ix_venue_genres_genre_venue_id', 'genre', 'venue_id'),)
+
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True)
+  genre = db.Column(db.String(50), db.ForeignKey('genres.name'), primary_key=True)
+
+  def __repr__(self):
+    return f'<VenueGenre venue_id: {self.venue_id}, genre: {self.genre}>'
+
+class ArtistGenre(db.Model):
+  __tablename__ = 'artist_genres'
+  __table_args__ = (db.Index('ix_artist_genres_genre_artist_id', 'genre', 'artist_id'),)
+
+  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True)
+  genre = db.Column(db.String(50), db.ForeignKey('genres.name'), primary_key=True)
+
+  def __repr__(self):
+    return f'<ArtistGenre artist_id: {self.artist_id}, genre: {self.genre}>'
+
+class ShowCountsState(db.Model):
+  # a single row: where counters.py last split upcoming from past shows
+  __tablename__ = 'show_counts_state'
+
+  id = db.Column(db.Integer, primary_key=True)
+  reconciled_at = db.Column(db.DateTime, nullable=False)
+
+  def __repr__(self):
+    return f'<ShowCountsState reconciled_at: {self.reconciled_at}>'
+
+@event.listens_for(ShowCountsState.__table__, 'after_create')
+def seed_show_counts_state(target, connection, **kw):
+  connection.execute(target.insert(), [{'id': 1, 'reconciled_at': datetime.now()}])
+
+class ListingVersion(db.Model):
+  # one row per listing page, bumped by every write it shows (versions.py)
+  __tablename__ = 'listing_versions'
+
+  name = db.Column(db.String(20), primary_key=True)
+  version = db.Column(db.Integer, nullable=False)
+  changed_at = db.Column(db.DateTime, nullable=False)
+
+  def __repr__(self):
+    return f'<ListingVersion name: {self.name}, version: {self.version}>'
+
+@event.listens_for(ListingVersion.__table__, 'after_create')
+def seed_listing_versions(target, connection, **kw):
+  listing_versions.seed(connection)
+
+class Job(db.Model):
+  # background work, see jobs.py
+  __tablename__ = 'jobs'
+  __table_args__ = (
+    # claiming due jobs
+    db.Index('ix_jobs_state_run_at', 'state', 'run_at'),
+    # one job per scheduled task and slot, whichever runner enqueues it
+    db.Index('uq_jobs_name_scheduled_for', 'name', 'scheduled_for', unique=True),
+  )
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String(100), nullable=False)
+  payload = db.Column(db.JSON, nullable=False)
+  state = db.Column(db.String(20), nullable=False)
+  attempts = db.Column(db.Integer, nullable=False)
+  max_attempts = db.Column(db.Integer, nullable=False)
+  run_at = db.Column(db.DateTime, nullable=False)
+  started_at = db.Column(db.DateTime)
+  finished_at = db.Column(db.DateTime)
+  last_error = db.Column(db.Text)
+  # start of the JOB_SCHEDULE slot of a periodic job, None for the others
+  scheduled_for = db.Column(db.DateTime)
+  created_at = db.Column(db.DateTime, nullable=False, default=datetime.now,
+    server_default=db.func.current_timestamp())
+
+  def __repr__(self):
+    return f'<Job id: {self.id}, name: {self.name}, state: {self.state}>'
+
 # TODO== Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+# searchable columns, name first (see search.py and the search index migration)
+VENUE_SEARCH_COLUMNS = [Venue.name, Venue.city, Venue.state]
+ARTIST_SEARCH_COLUMNS = [Artist.name, Artist.city, Artist.state]
+VENUE_SEARCH_GENRES = (VenueGenre.venue_id, VenueGenre.genre, MusicGenre.name)
+ARTIST_SEARCH_GENRES = (ArtistGenre.artist_id, ArtistGenre.genre, MusicGenre.name)
+search.register_fts(Venue, VENUE_SEARCH_COLUMNS)
+search.register_fts(Artist, ARTIST_SEARCH_COLUMNS)
+
+# name prefixes of the typeahead pickers (see typeahead.py and its migration)
+for model in (Venue, Artist):
+  db.Index(f'ix_{model.__tablename__}_name_prefix', db.func.lower(model.name).label('name_prefix'),
+    postgresql_ops={'name_prefix': 'text_pattern_ops'})
+
+# columns read into the view models, in their field order
+SHOW_TILE_COLUMNS = [Show.start_time,
+  Show.venue_id, Venue.name.label('venue_name'), Venue.image_link.label('venue_image_link'),
+  Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'),
+  Venue.updated_at.label('venue_updated_at'), Artist.updated_at.label('artist_updated_at')]
+VENUE_COLUMNS = [Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+  Venue.image_link, Venue.facebook_link, Venue.website, Venue.seeking_talent, Venue.seeking_description,
+  Venue.updated_at]
+VENUE_SHOW_COLUMNS = [Show.start_time, Show.artist_id, Artist.name, Artist.image_link, Artist.updated_at]
+VENUE_PAGE_COLUMNS = VENUE_COLUMNS + VENUE_SHOW_COLUMNS
+ARTIST_COLUMNS = [Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+  Artist.image_link, Artist.facebook_link, Artist.website, Artist.seeking_venue, Artist.seeking_description,
+  Artist.updated_at]
+ARTIST_SHOW_COLUMNS = [Show.start_time, Show.venue_id, Venue.name, Venue.image_link, Venue.updated_at]
+ARTIST_PAGE_COLUMNS = ARTIST_COLUMNS + ARTIST_SHOW_COLUMNS
+
+def cache_tags_for(instance):
+  # page cache tags touched by writing this row (see cache.py)
+  if isinstance(instance, Venue):
+    return {f'venue:{instance.id}', 'venues'}
+  if isinstance(instance, Artist):
+    return {f'artist:{instance.id}', 'artists'}
+  if isinstance(instance, Show):
+    # upcoming show counts are part of the /venues and /artists listings
+    return {f'venue:{instance.venue_id}', f'artist:{instance.artist_id}', 'shows', 'venues', 'artists'}
+  if isinstance(instance, VenueGenre):
+    return {f'venue:{instance.venue_id}', 'venues'}
+  if isinstance(instance, ArtistGenre):
+    return {f'artist:{instance.artist_id}', 'artists'}
+  return set()
+
+def listings_written_by(instance, deleted):
+  # listing pages that show this row; a deleted venue or artist takes its
+  # shows, and the other side's show counts, with it
+  if isinstance(instance, Venue):
+    return {'venues', 'shows'} | ({'artists'} if deleted else set())
+  if isinstance(instance, Artist):
+    return {'artists', 'shows'} | ({'venues'} if deleted else set())
+  if isinstance(instance, Show):
+    return {'shows', 'venues', 'artists'}
+  if isinstance(instance, VenueGenre):
+    return {'venues'}
+  if isinstance(instance, ArtistGenre):
+    return {'artists'}
+  return set()
+
+def cache_variant():
+  # a client pinned to the primary after a write neither reads nor fills
+  # the page cache; other pages are cached apart per database they are
+  # read from, so a lagging replica's page never stands in for the primary's
+  if replica_router.pinned():
+    return None
+  replica = db.session().read_replica()
+  return 'primary:' if replica is None else replica.url.render_as_string(hide_password=True) + ':'
+
+page_cache.tags_for = cache_tags_for
+page_cache.variant = cache_variant
+page_cache.watch(db.session)
+listing_versions = ListingVersions(ListingVersion, listings_written_by)
+listing_versions.watch(db.session)
+show_counters = ShowCounters(Show, Venue, Artist, ShowCountsState)
+show_counters.watch(db.session)
+venue_names = PrefixIndex(Venue, app.config['TYPEAHEAD_REFRESH_SECONDS'])
+venue_names.watch(db.session)
+artist_names = PrefixIndex(Artist, app.config['TYPEAHEAD_REFRESH_SECONDS'])
+artist_names.watch(db.session)
+job_queue = JobQueue(app, Job, lambda: db.engine)
+job_queue.watch(db.session)
+request_metrics.collect('fyyur_page_cache_hits_total', 'Pages served from the page cache.',
+  'counter', lambda: page_cache.hits)
+request_metrics.collect('fyyur_page_cache_misses_total', 'Cacheable pages rendered by their view.',
+  'counter', lambda: page_cache.misses)
+db_pool.pool_collectors(request_metrics, lambda: db.engine)
+request_metrics.collect('fyyur_replica_healthy', 'Whether a read replica takes reads.',
+  'gauge', replica_router.healthy, ('replica',))
+request_metrics.collect('fyyur_replica_sessions_total', 'Request sessions routed to a read replica.',
+  'counter', replica_router.sessions, ('replica',))
+request_metrics.collect('fyyur_fragment_cache_hits_total', 'Template fragments served from cache.',
+  'counter', lambda: fragment_cache.hits)
+request_metrics.collect('fyyur_fragment_cache_misses_total', 'Template fragments rendered and cached.',
+  'counter', lambda: fragment_cache.misses)
+request_metrics.collect('fyyur_jobs', 'Jobs in the job table, by state.',
+  'gauge', job_queue.depth, ('state',))
+request_metrics.collect('fyyur_jobs_oldest_due_seconds', 'How long the oldest due job has waited to run.',
+  'gauge', job_queue.oldest_due_seconds)
+request_metrics.collect('fyyur_jobs_run_total', 'Jobs run by this process, by task and outcome.',
+  'counter', lambda: dict(job_queue.runs), ('task', 'outcome'))
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
+DATETIME_LOCALE = babel.Locale.parse('en')
+
+@functools.lru_cache(maxsize=32)
+def datetime_pattern(format):
+  # parsing the babel pattern costs more than applying it
   if format == 'full':
       format="EEEE MMMM, d, y 'at' h:mma"
   elif format == 'medium':
       format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+  return babel.dates.parse_pattern(format)
+
+def format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value) if isinstance(value, str) else value
+  if date.tzinfo is None:
+    # what babel.dates.format_datetime assumes for naive datetimes
+    date = date.replace(tzinfo=timezone.utc)
+  return datetime_pattern(format).apply(date, DATETIME_LOCALE)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def listing_state(name):
+  # (version, last change) of a listing page, as scalar subqueries
+  version = db.session.query(ListingVersion).filter(ListingVersion.name == name)
+  return [
+    version.with_entities(ListingVersion.version).scalar_subquery(),
+    version.with_entities(ListingVersion.changed_at).scalar_subquery()
+  ]
+
+def show_counts_reconciled_at():
+  # listed show counts change when the reconciler moves shows to the past
+  return db.session.query(ShowCountsState.reconciled_at).scalar_subquery()
+
+def last_passed_start_time(shows):
+  # the page changes when a show moves from upcoming to past
+  return shows.filter(Show.start_time <= datetime.now()).with_entities(
+    db.func.max(Show.start_time)).scalar_subquery()
+
+def page_validators(query):
+  # run the validator query in one round trip; last modified is the latest
+  # datetime it returns (see cache.conditional)
+  state = query.one_or_none()
+  if state is None:
+    return None
+  times = [value for value in state if isinstance(value, datetime)]
+  return (max(times) if times else None), tuple(state)
+
+def venues_validators(genre=None):
+  return page_validators(db.session.query(*listing_state('venues'), show_counts_reconciled_at()))
+
+def artists_validators(genre=None):
+  return page_validators(db.session.query(*listing_state('artists'), show_counts_reconciled_at()))
+
+def shows_validators():
+  # the first page also moves on at midnight
+  last_modified, state = page_validators(db.session.query(*listing_state('shows')))
+  today = shows_today()
+  return max(last_modified, today), state + (today,)
+
+def show_venue_validators(venue_id):
+  shows = Show.query.filter(Show.venue_id == venue_id)
+  return page_validators(db.session.query(
+    Venue.updated_at,
+    shows.with_entities(db.func.max(Show.updated_at)).scalar_subquery(),
+    shows.with_entities(db.func.count()).scalar_subquery(),
+    last_passed_start_time(shows),
+    db.session.query(db.func.max(Artist.updated_at)).filter(
+      Artist.id.in_(shows.with_entities(Show.artist_id))).scalar_subquery()
+  ).filter(Venue.id == venue_id))
+
+def show_artist_validators(artist_id):
+  shows = Show.query.filter(Show.artist_id == artist_id)
+  return page_validators(db.session.query(
+    Artist.updated_at,
+    shows.with_entities(db.func.max(Show.updated_at)).scalar_subquery(),
+    shows.with_entities(db.func.count()).scalar_subquery(),
+    last_passed_start_time(shows),
+    db.session.query(db.func.max(Venue.updated_at)).filter(
+      Venue.id.in_(shows.with_entities(Show.venue_id))).scalar_subquery()
+  ).filter(Artist.id == artist_id))
+
+def calendar_window():
+  # [start, end) from the `start` and `end` query arguments (ISO dates or
+  # datetimes), starting today by default; abort(400) when malformed.
+  # Show times are naive server-local times: one with a UTC offset is
+  # converted to that
+  try:
+    start, end = [datetime.fromisoformat(request.args[name]) if request.args.get(name) else None
+      for name in ('start', 'end')]
+  except ValueError:
+    abort(400)
+  start, end = [value.astimezone().replace(tzinfo=None) if value and value.tzinfo else value
+    for value in (start, end)]
+  start = start or datetime.combine(datetime.today(), datetime.min.time())
+  end = end or start + timedelta(days=app.config['CALENDAR_DEFAULT_DAYS'])
+  if not start < end <= start + timedelta(days=app.config['CALENDAR_MAX_DAYS']):
+    abort(400)
+  return start, end
+
+def calendar_response(owner, owner_id, start, end, shows):
+  length = timedelta(minutes=app.config['BOOKING_LENGTH_MINUTES'])
+  return jsonify({
+    f'{owner}_id': owner_id,
+    'start': start.isoformat(),
+    'end': end.isoformat(),
+    'shows': [dict(show, start_time=show['start_time'].isoformat(),
+      end_time=(show['start_time'] + length).isoformat()) for show in shows]
+  })
+
+def delete_listings(model, ids):
+  # deletes venues or artists with one DELETE; their shows and genre links
+  # go with them by ON DELETE CASCADE, nothing is loaded. Returns the ids
+  # that existed. The caller commits.
+  ids = set(ids)
+  changed_venues, changed_artists = show_counters.forget(db.session,
+    ids if model is Venue else (), ids if model is Artist else ())
+  deleted = sorted(db.session.execute(
+    db.delete(model).where(model.id.in_(ids)).returning(model.id)).scalars())
+
+  # what cache_tags_for would give for the venues or artists and their shows
+  owner = model.__tablename__
+  tags = {owner} | {f'{owner[:-1]}:{row_id}' for row_id in deleted}
+  if changed_venues or changed_artists:
+    tags |= {'shows', 'venues', 'artists'} | {f'venue:{row_id}' for row_id in changed_venues} | \
+      {f'artist:{row_id}' for row_id in changed_artists}
+  page_cache.stage(db.session, tags)
+  if deleted:
+    listing_versions.bump(db.session.connection(), LISTINGS)
+  (venue_names if model is Venue else artist_names).stage(db.session, [(row_id, None) for row_id in deleted])
+  return deleted
+
+def delete_response(model, ids):
+  # {"state": ..., "deleted": [ids]} of a delete_listings() call
+  try:
+    deleted = delete_listings(model, ids)
+    body = {'state': 'success', 'deleted': deleted}
+    db.session.commit()
+  except:
+    deleted = []
+    body = {'state': 'failed'}
+    print(sys.exc_info())
+    db.session.rollback()
+  finally:
+    db.session.close()
+  return body, deleted
+
+def bulk_delete_ids():
+  # the `ids` list of a bulk delete's JSON body; abort(400) when malformed
+  ids = (request.get_json(silent=True) or {}).get('ids')
+  if not isinstance(ids, list) or not all(type(row_id) is int for row_id in ids) or \
+      len(ids) > app.config['BULK_DELETE_MAX_IDS']:
+    abort(400)
+  return ids
+
+def typeahead_response(names):
+  # {"q": ..., "data": [{"id": ..., "name": ...}]} of the names starting
+  # with the `q` query argument
+  prefix = request.args.get('q', '').strip()
+  limit = app.config['TYPEAHEAD_LIMIT']
+  if not prefix:
+    matches = []
+  elif app.config['TYPEAHEAD_INDEX_ENABLED']:
+    names.refresh(db.session)
+    matches = names.search(prefix, limit)
+  else:
+    matches = prefix_query(db.session, names.model, prefix, limit).all()
+  return jsonify({'q': prefix, 'data': [{'id': row_id, 'name': name} for row_id, name in matches]})
+
+def page_args(values, start=None):
+  # (after, before, per_page) from a query string or posted form mapping;
+  # `start` is the after cursor of a request without cursors
+  try:
+    per_page = int(values.get('per_page') or app.config['PAGE_SIZE'])
+  except ValueError:
+    per_page = app.config['PAGE_SIZE']
+  per_page = max(1, min(per_page, app.config['MAX_PAGE_SIZE']))
+  after, before = values.get('after'), values.get('before')
+  if not (after or before):
+    after = start
+  return after, before, per_page
+
+def paginate(query, columns, start=None):
+  # cursors and page size come from the query string or the posted form
+  after, before, per_page = page_args(request.values, start)
+  try:
+    return keyset_paginate(query, columns, after=after, before=before, per_page=per_page)
+  except ValueError:
+    abort(400)
+
+# listing queries, shared with the async read mode (asgi.py); each returns
+# the query and its unique sort key for keyset pagination
+
+def venues_query(genre=None):
+  # venues ordered by their normalized area, with their upcoming show
+  # counter; shows are not read at all
+  area_city = db.func.lower(Venue.city)
+  area_state = db.func.lower(Venue.state)
+  query = db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state,
+    area_city.label('area_city'), area_state.label('area_state'),
+    Venue.upcoming_shows_count.label('num_upcoming_shows'))
+  if genre is not None:
+    # served by the (genre, venue_id) index of venue_genres
+    query = query.join(VenueGenre, VenueGenre.venue_id == Venue.id).filter(VenueGenre.genre == genre)
+  return query, [area_city.label('area_city'), area_state.label('area_state'), Venue.name, Venue.id]
+
+def venue_areas(venues):
+  # rows arrive sorted by area, so grouping them is a single pass
+  data = []
+  for (_, _), rows in itertools.groupby(venues, key=lambda v: (v.area_city, v.area_state)):
+    rows = list(rows)
+    data.append({
+      'city': rows[0].city,
+      'state': rows[0].state,
+      'venues': rows
+    })
+  return data
+
+def artists_query(genre=None):
+  query = db.session.query(Artist.id, Artist.name, Artist.upcoming_shows_count.label('num_upcoming_shows'))
+  if genre is not None:
+    # served by the (genre, artist_id) index of artist_genres
+    query = query.join(ArtistGenre, ArtistGenre.artist_id == Artist.id).filter(ArtistGenre.genre == genre)
+  return query, [Artist.name, Artist.id]
+
+def shows_query():
+  # shows in primary key order, with venue and artist joined in
+  query = db.session.query(*SHOW_TILE_COLUMNS) \
+    .join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+  return query, [Show.start_time, Show.venue_id, Show.artist_id]
+
+def shows_today():
+  # the first /shows page starts at today's shows, a seek on
+  # ix_shows_start_time rather than a walk from the oldest show; earlier
+  # shows are pages back
+  return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+def shows_start():
+  return encode_cursor([shows_today(), 0, 0])
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -116,33 +612,19 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
-def venues():
+@app.route('/venues/genres/<genre>')
+@conditional(venues_validators)
+@page_cache.cached
+def venues(genre=None):
   # TODO==: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-  # getting all the venues
-  venues = Venue.query.all()
-
-  # grouping the venues by city and state
-  city_state_dic = {}
-  for v in venues:
-    city_state = v.city.lower() + ', ' + v.state.lower()
-    vlist = city_state_dic.get(city_state)
-    if not vlist:
-      vlist = []
-      city_state_dic[city_state] = vlist
-    vlist.append(v)
+  if genre is not None and not MusicGenre.query.get(genre):
+    abort(404)
+  venues = paginate(*venues_query(genre))
+  add_tags('venues')
 
-  # construct final dic to send as a model to the view
-  data = []
-  for value in city_state_dic.values():
-    data.append({
-      'city': value[0].city,
-      'state': value[0].state,
-      'venues': value
-    })
-  
-  return render_template('pages/venues.html', areas=data);
+  return render_template('pages/venues.html', areas=venue_areas(venues), page=venues, genre=genre);
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -150,58 +632,66 @@ def search_venues():
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   search_term = request.form.get('search_term', '')
-  like_search = '%{}%'.format(search_term)
-  data = Venue.query.filter(Venue.name.ilike(like_search)).all()
+  query, sort_key = search.search(db.session, Venue, VENUE_SEARCH_COLUMNS, search_term,
+    genres=VENUE_SEARCH_GENRES)
+  data = paginate(query, sort_key)
 
   response={
-    "count": len(data),
+    "count": query.count(),
     "data": data
   }
 
-  return render_template('pages/search_venues.html', results=response, search_term = search_term)
+  return render_template('pages/search_venues.html', results=response, search_term = search_term, page=data)
 
 @app.route('/venues/<int:venue_id>')
+@conditional(show_venue_validators)
+@page_cache.cached
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO##: replace with real venue data from the venues table, using venue_id
   
-  # using sqlalchemy to get the data from db
-  venue = Venue.query.get(venue_id)
-  
-  if not venue:
+  # the venue's columns with one row per upcoming show and its artist,
+  # plain tuples rather than ORM instances; bounded on start_time, so only
+  # the current and future partitions of shows are read
+  now = datetime.now()
+  rows = db.session.query(*VENUE_PAGE_COLUMNS) \
+    .outerjoin(Show, db.and_(Show.venue_id == Venue.id, Show.start_time > now)) \
+    .outerjoin(Artist, Artist.id == Show.artist_id) \
+    .filter(Venue.id == venue_id).order_by(Show.start_time).all()
+  if not rows:
     return abort(404)
+  past = db.session.query(*VENUE_SHOW_COLUMNS).select_from(Show) \
+    .join(Artist, Artist.id == Show.artist_id) \
+    .filter(Show.venue_id == venue_id, Show.start_time < now).order_by(Show.start_time).all()
+  genres = [genre for (genre,) in db.session.query(VenueGenre.genre)
+    .filter(VenueGenre.venue_id == venue_id).order_by(VenueGenre.genre)]
+
+  venue = detail_page(VenuePage, VenueShow, rows, past, genres)
+  add_tags(f'venue:{venue.id}', *{f'artist:{show.artist_id}' for show in venue.past_shows + venue.upcoming_shows})
+
+  return render_template('pages/show_venue.html', venue=venue)
+
+@app.route('/venues/<int:venue_id>/calendar')
+@page_cache.cached
+def venue_calendar(venue_id):
+  # the venue's shows starting within the window, one bounded range scan
+  # of the (venue_id, start_time) index; the venue row comes along so a
+  # missing venue is told apart from an empty calendar
+  start, end = calendar_window()
+  rows = db.session.query(Venue.id, Show.start_time, Show.artist_id, Artist.name, Artist.image_link) \
+    .outerjoin(Show, db.and_(Show.venue_id == Venue.id, Show.start_time >= start, Show.start_time < end)) \
+    .outerjoin(Artist, Artist.id == Show.artist_id) \
+    .filter(Venue.id == venue_id).order_by(Show.start_time).all()
+  if not rows:
+    abort(404)
+  shows = [{'start_time': start_time, 'artist_id': artist_id, 'artist_name': name, 'artist_image_link': image_link}
+    for _, start_time, artist_id, name, image_link in rows if start_time is not None]
+  add_tags(f'venue:{venue_id}', *{f'artist:{show["artist_id"]}' for show in shows})
+  return calendar_response('venue', venue_id, start, end, shows)
 
-  artists_dic = {}
-  def get_show_data(show):
-    artist_id_str = str(show.artist_id)
-    if not artists_dic.get(artist_id_str):
-      artists_dic[artist_id_str] = Artist.query.get(show.artist_id)
-    artist = artists_dic[artist_id_str]
-    return {
-      'start_time': show.start_time.isoformat(),
-      'artist_id': artist.id,
-      'artist_name': artist.name,
-      'artist_image_link': artist.image_link
-    }
-  
-  past_shows = []
-  for show in Show.query.filter(Show.start_time < datetime.now(), Show.venue_id == venue_id).all():
-    past_shows.append(get_show_data(show))
-    
-  upcoming_shows = []
-  for show in Show.query.filter(Show.start_time > datetime.now(), Show.venue_id == venue_id).all():
-    upcoming_shows.append(get_show_data(show))
-
-  # construct the final data dictionary to send to the view page
-  data = vars(venue).copy()
-  data.pop('_sa_instance_state', None)
-  data['upcoming_shows'] = upcoming_shows
-  data['past_shows'] = past_shows
-  data['genres'] = re.compile(',\s*').split(data['genres']) # split by comma
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
-
-  return render_template('pages/show_venue.html', venue=data)
+@app.route('/venues/typeahead')
+def venues_typeahead():
+  return typeahead_response(venue_names)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -225,7 +715,7 @@ def create_venue_submission():
     error = False
     venue = Venue(name=request.form.get('name'), city=request.form.get('city'),
       state=request.form.get('state'), address=request.form.get('address'),
-      genres=', '.join(request.form.getlist('genres')), phone=request.form.get('phone'), 
+      genres=request.form.getlist('genres'), phone=request.form.get('phone'), 
       facebook_link=request.form.get('facebook_link'))
     db.session.add(venue)
     flash_message = f'Venue {venue.name} was successfully listed'
@@ -247,32 +737,36 @@ def create_venue_submission():
 
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # TODO==: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-  try:
-    venue = Venue.query.get(venue_id)
-    db.session.delete(venue)
-    body = {'state': 'success'}
-    db.session.commit()
-  except:
-    body = {'state': 'failed'}
-    print(sys.exc_info())
-    db.session.rollback()
-  finally:
-    db.session.close()
+  body, deleted = delete_response(Venue, [venue_id])
+  if body['state'] == 'success' and not deleted:
+    return jsonify({'state': 'failed'}), 404
   return jsonify(body)
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
 
+@app.route('/venues', methods=['DELETE'])
+def delete_venues():
+  # {"ids": [...]}: many stale venues in one statement and one transaction
+  body, _ = delete_response(Venue, bulk_delete_ids())
+  return jsonify(body)
+
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
-def artists():
+@app.route('/artists/genres/<genre>')
+@conditional(artists_validators)
+@page_cache.cached
+def artists(genre=None):
   # TODO==: replace with real data returned from querying the database
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  if genre is not None and not MusicGenre.query.get(genre):
+    abort(404)
+  data = paginate(*artists_query(genre))
+  add_tags('artists')
+  return render_template('pages/artists.html', artists=data, page=data, genre=genre)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -280,56 +774,73 @@ def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
   search_term = request.form.get('search_term', '')
-  like_search = '%{}%'.format(search_term)
-  artists = Artist.query.filter(Artist.name.ilike(like_search)).all()
+  query, sort_key = search.search(db.session, Artist, ARTIST_SEARCH_COLUMNS, search_term,
+    genres=ARTIST_SEARCH_GENRES)
+  artists = paginate(query, sort_key)
   response = {
-    "count": len(artists),
+    "count": query.count(),
     "data": artists
   }
-  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term, page=artists)
 
 @app.route('/artists/<int:artist_id>')
+@conditional(show_artist_validators)
+@page_cache.cached
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO==: replace with real venue data from the venues table, using venue_id
   
-  # using sqlalchemy to get the data from db
-  artist = Artist.query.get(artist_id)
-
-  if not artist:
+  # the artist's columns with one row per upcoming show and its venue,
+  # then the past shows (see show_venue)
+  now = datetime.now()
+  rows = db.session.query(*ARTIST_PAGE_COLUMNS) \
+    .outerjoin(Show, db.and_(Show.artist_id == Artist.id, Show.start_time > now)) \
+    .outerjoin(Venue, Venue.id == Show.venue_id) \
+    .filter(Artist.id == artist_id).order_by(Show.start_time).all()
+  if not rows:
     abort(404)
-  
-  venues_dic = {}
-  def get_show_data(show):
-    venue_id_str = str(show.venue_id)
-    if not venues_dic.get(venue_id_str):
-      venues_dic[venue_id_str] = Venue.query.get(show.venue_id)
-    venue = venues_dic[venue_id_str]
-    return {
-      'start_time': show.start_time.isoformat(),
-      'venue_id': venue.id,
-      'venue_name': venue.name,
-      'venue_image_link': venue.image_link
-    }
-  
-  past_shows = []
-  for show in Show.query.filter(Show.start_time < datetime.now(), Show.artist_id == artist_id).all():
-    past_shows.append(get_show_data(show))
-    
-  upcoming_shows = []
-  for show in Show.query.filter(Show.start_time > datetime.now(), Show.artist_id == artist_id).all():
-    upcoming_shows.append(get_show_data(show))
-
-  # construct the final data dictionary to send to the view page
-  data = vars(artist).copy()
-  data.pop('_sa_instance_state', None)
-  data['upcoming_shows'] = upcoming_shows
-  data['past_shows'] = past_shows
-  data['genres'] = re.compile(',\s*').split(data['genres']) # split by comma
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
-
-  return render_template('pages/show_artist.html', artist=data)
+  past = db.session.query(*ARTIST_SHOW_COLUMNS).select_from(Show) \
+    .join(Venue, Venue.id == Show.venue_id) \
+    .filter(Show.artist_id == artist_id, Show.start_time < now).order_by(Show.start_time).all()
+  genres = [genre for (genre,) in db.session.query(ArtistGenre.genre)
+    .filter(ArtistGenre.artist_id == artist_id).order_by(ArtistGenre.genre)]
+
+  artist = detail_page(ArtistPage, ArtistShow, rows, past, genres)
+  add_tags(f'artist:{artist.id}', *{f'venue:{show.venue_id}' for show in artist.past_shows + artist.upcoming_shows})
+
+  return render_template('pages/show_artist.html', artist=artist)
+
+@app.route('/artists/<int:artist_id>/calendar')
+@page_cache.cached
+def artist_calendar(artist_id):
+  # as venue_calendar, on the (artist_id, start_time) index
+  start, end = calendar_window()
+  rows = db.session.query(Artist.id, Show.start_time, Show.venue_id, Venue.name, Venue.image_link) \
+    .outerjoin(Show, db.and_(Show.artist_id == Artist.id, Show.start_time >= start, Show.start_time < end)) \
+    .outerjoin(Venue, Venue.id == Show.venue_id) \
+    .filter(Artist.id == artist_id).order_by(Show.start_time).all()
+  if not rows:
+    abort(404)
+  shows = [{'start_time': start_time, 'venue_id': venue_id, 'venue_name': name, 'venue_image_link': image_link}
+    for _, start_time, venue_id, name, image_link in rows if start_time is not None]
+  add_tags(f'artist:{artist_id}', *{f'venue:{show["venue_id"]}' for show in shows})
+  return calendar_response('artist', artist_id, start, end, shows)
+
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  body, deleted = delete_response(Artist, [artist_id])
+  if body['state'] == 'success' and not deleted:
+    return jsonify({'state': 'failed'}), 404
+  return jsonify(body)
+
+@app.route('/artists', methods=['DELETE'])
+def delete_artists():
+  body, _ = delete_response(Artist, bulk_delete_ids())
+  return jsonify(body)
+
+@app.route('/artists/typeahead')
+def artists_typeahead():
+  return typeahead_response(artist_names)
 
 #  Update
 #  ----------------------------------------------------------------
@@ -342,7 +853,7 @@ def edit_artist(artist_id):
     abort(404)
   
   # set default values for genres & state
-  form.genres.default = re.compile(',\s*').split(artist.genres)
+  form.genres.default = list(artist.genres)
   form.state.default = artist.state
   form.process()
 
@@ -368,8 +879,10 @@ def edit_artist_submission(artist_id):
     artist.city = request.form.get('city')
     artist.state = request.form.get('state')
     artist.phone = request.form.get('phone')
-    artist.genres = ', '.join(request.form.getlist('genres'))
+    artist.genres = request.form.getlist('genres')
     artist.facebook_link = request.form.get('facebook_link')
+    # genres live in artist_genres, so always bump the row itself
+    artist.updated_at = datetime.now()
     db.session.commit()
   except:
     db.session.rollback()
@@ -387,7 +900,7 @@ def edit_venue(venue_id):
   if not venue:
     abort(404)
   # setting default values for genres & state
-  form.genres.default = re.compile(',\s*').split(venue.genres)
+  form.genres.default = list(venue.genres)
   form.state.default = venue.state
   form.process()
   # TODO==: populate form with values from venue with ID <venue_id>
@@ -413,8 +926,10 @@ def edit_venue_submission(venue_id):
     venue.state = request.form.get('state')
     venue.address = request.form.get('address')
     venue.phone = request.form.get('phone')
-    venue.genres = ', '.join(request.form.getlist('genres'))
+    venue.genres = request.form.getlist('genres')
     venue.facebook_link = request.form.get('facebook_link')
+    # genres live in venue_genres, so always bump the row itself
+    venue.updated_at = datetime.now()
     db.session.commit()
   except:
     db.session.rollback()
@@ -447,7 +962,7 @@ def create_artist_submission():
   try:
     error = False
     artist = Artist(name=request.form.get('name'), city=request.form.get('city'),
-      state=request.form.get('state'), genres=', '.join(request.form.getlist('genres'))
+      state=request.form.get('state'), genres=request.form.getlist('genres')
       ,phone=request.form.get('phone'), facebook_link=request.form.get('facebook_link')
       )
     db.session.add(artist)
@@ -473,37 +988,18 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(shows_validators)
+@page_cache.cached
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-  venues_dic = {}
-  artists_dic = {}
-  def get_show_data(show):
-    venue_id_str = str(show.venue_id)
-    artist_id_str = str(show.artist_id)
-    if not venues_dic.get(venue_id_str):
-      venues_dic[venue_id_str] = Venue.query.get(show.venue_id)
-    if not artists_dic.get(artist_id_str):
-      artists_dic[artist_id_str] = Artist.query.get(show.artist_id)
-    artist = artists_dic[artist_id_str]
-    venue = venues_dic[venue_id_str]
-    return {
-      'start_time': show.start_time.isoformat(),
-      'venue_id': venue.id,
-      'venue_name': venue.name,
-      'venue_image_link': venue.image_link,
-      'artist_id': artist.id,
-      'artist_name': artist.name,
-      'artist_image_link': artist.image_link
-    }
-  
-  data = []
-  for show in Show.query.all():
-    data.append(get_show_data(show))
-  
-  return render_template('pages/shows.html', shows=data)
+  page = paginate(*shows_query(), start=shows_start())
+  data = [ShowTile._make(row) for row in page]
+  add_tags('shows', *{f'venue:{show.venue_id}' for show in page}, *{f'artist:{show.artist_id}' for show in page})
+
+  return render_template('pages/shows.html', shows=data, page=page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -515,15 +1011,49 @@ def create_shows():
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO==: insert form data as a new Show record in the db, instead
+  form = ShowForm()
+  if not form.validate():
+    flash(form.errors, 'error')
+    return render_template('pages/home.html')
+
+  venue_id, artist_id = form.venue_id.data, form.artist_id.data
+  limit = app.config['SERIES_MAX_OCCURRENCES']
+  start_times = bookings.occurrences(form.start_time.data, form.repeat.data,
+    form.occurrences.data, form.until.data, limit=limit)
+  if len(start_times) > limit:
+    flash(f'A series can have at most {limit} shows. Show could not be listed', 'error')
+    return render_template('pages/home.html')
+
   try:
     error = False
-    show = Show(artist_id=request.form.get('artist_id'), 
-      venue_id=request.form.get('venue_id'),
-      start_time=request.form.get('start_time')
-    )
-    db.session.add(show)
-    flash_message = 'Show was successfully listed!'
-    db.session.commit()
+    # no other booking of this venue or artist until we commit
+    bookings.lock(db.session, venue_id, artist_id)
+    taken = bookings.conflicts(db.session, Show, venue_id, artist_id, start_times,
+      timedelta(minutes=app.config['BOOKING_LENGTH_MINUTES']))
+    if taken:
+      # all or nothing: a series with a conflict lists none of its shows
+      error = True
+      def taken_by(other):
+        booked = 'venue' if other.venue_id == venue_id else 'artist'
+        return f'{booked} already has a show at {other.start_time:%Y-%m-%d %H:%M}'
+      if len(start_times) == 1:
+        flash_message = f'The {taken_by(taken[start_times[0]][0])}. Show could not be listed'
+      else:
+        flash_message = f'{len(taken)} of {len(start_times)} shows conflict, none were listed: ' + '; '.join(
+          f'{start_time:%Y-%m-%d}: the {taken_by(others[0])}' for start_time, others in taken.items())
+    else:
+      # one flush, so one multi-row INSERT for the whole series
+      db.session.add_all([Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
+        for start_time in start_times])
+      if page_cache.backend is not None and not replica_router.replicas:
+        # the commit empties them from the cache; refill them off the request
+        job_queue.enqueue(db.session, 'warm_pages', paths=['/shows', '/venues', '/artists',
+          f'/venues/{venue_id}', f'/artists/{artist_id}'])
+      if len(start_times) == 1:
+        flash_message = 'Show was successfully listed!'
+      else:
+        flash_message = f'{len(start_times)} shows were successfully listed!'
+      db.session.commit()
   except:
     error = True
     flash_message = 'An error occurred. Show could not be listed'
@@ -540,6 +1070,247 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(shows, venues, artists):kind>.<any(csv, ndjson):file_format>')
+def export(kind, file_format):
+  # streamed straight from a server-side cursor, never built in memory
+  engine = (replica_router.reading() and replica_router.engine()) or db.engine
+  rows = exporter.export(engine, db.metadata.tables, kind, file_format)
+  return Response(stream_with_context(rows), mimetype=exporter.FORMATS[file_format],
+    headers={'Content-Disposition': f'attachment; filename={kind}.{file_format}'})
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics')
+def metrics():
+  return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+#  Profiles
+#  ----------------------------------------------------------------
+
+@app.route('/profiles')
+def profiles():
+  if not profiler.enabled:
+    abort(404)
+  return render_template('pages/profiles.html', profiles=profiler.profiles()[:50])
+
+@app.route('/profiles/<name>')
+def profile(name):
+  if not profiler.enabled:
+    abort(404)
+  return send_from_directory(profiler.directory, name, mimetype='text/plain')
+
+#----------------------------------------------------------------------------#
+# Jobs.
+#----------------------------------------------------------------------------#
+
+@job_queue.task()
+def warm_pages(paths):
+  # renders pages into the page cache so the next visitor gets a hit; only
+  # reaches web processes with the redis backend or the thread runner.
+  # Not with replicas: they may not have the write that asked for this yet,
+  # and visitors read cached pages of the replicas, not of the primary
+  if page_cache.backend is None or replica_router.replicas:
+    return
+  client = app.test_client()
+  for path in paths:
+    client.get(path)
+
+@job_queue.task()
+def reconcile_show_counts():
+  moved = show_counters.reconcile(db.session)
+  db.session.commit()
+  page_cache.invalidate({'venues', 'artists'})
+  return moved
+
+@job_queue.task()
+def create_partitions():
+  # keeps the months ahead in place (PostgreSQL, see partitions.py)
+  if db.engine.dialect.name != 'postgresql':
+    return
+  with db.engine.begin() as connection:
+    partitions.ensure_partitions(connection)
+
+@job_queue.task()
+def purge_jobs():
+  with db.engine.begin() as connection:
+    job_queue.purge(connection, datetime.now() - timedelta(days=app.config['JOB_RETENTION_DAYS']))
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def query_plan_urls():
+  # read routes of the first venue, artist, show and genre of the catalog
+  urls = ['/venues', '/artists', '/shows']
+  venue = Venue.query.order_by(Venue.id).first()
+  artist = Artist.query.order_by(Artist.id).first()
+  show = Show.query.order_by(Show.start_time).first()
+  genre = VenueGenre.query.first()
+  if venue:
+    urls += [f'/venues/{venue.id}', f'/venues/{venue.id}/calendar']
+  if artist:
+    urls += [f'/artists/{artist.id}', f'/artists/{artist.id}/calendar']
+  if show:
+    urls.append('/shows?after=' + encode_cursor([show.start_time, show.venue_id, show.artist_id]))
+  if genre:
+    urls.append(f'/venues/genres/{genre.genre}')
+  db.session.close()
+  return urls
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+  """Fail if a read route's query plan scans the whole shows table."""
+  urls = query_plan_urls()
+  failures = query_plans.check_query_plans(app, db, urls)
+  for url, statement, plan in failures:
+    click.echo(f'{url}: full scan of shows', err=True)
+    click.echo(f'  {statement}', err=True)
+    for line in plan:
+      click.echo(f'    {line}', err=True)
+  if failures:
+    sys.exit(1)
+  click.echo(f'checked {len(urls)} routes, no full scans of shows')
+
+@app.cli.command('reconcile-show-counts')
+@click.option('--recount', is_flag=True, help='Rebuild every counter from the shows table.')
+def reconcile_show_counts_command(recount):
+  """Move shows that started since the last run to the past show counts."""
+  if recount:
+    show_counters.recount(db.session)
+    db.session.commit()
+    click.echo('recounted the shows of every venue and artist')
+    page_cache.invalidate({'venues', 'artists'})
+  else:
+    moved = reconcile_show_counts()
+    click.echo(f'{moved} shows moved from upcoming to past')
+
+@app.cli.group('partitions')
+def partitions_command():
+  """Manage the monthly partitions of shows (PostgreSQL)."""
+  if db.engine.dialect.name != 'postgresql':
+    raise click.ClickException('shows is only partitioned on PostgreSQL')
+
+@partitions_command.command('list')
+def list_partitions_command():
+  """List the monthly partitions of shows, oldest first."""
+  with db.engine.connect() as connection:
+    for partition in partitions.partitions(connection):
+      click.echo(f'{partition.name}  {partition.start:%Y-%m-%d} to {partition.end:%Y-%m-%d}  ~{partition.rows} rows')
+
+@partitions_command.command('create')
+@click.option('--ahead', default=partitions.AHEAD, show_default=True,
+  help='Months to have in place after the current one.')
+@click.option('--since', type=click.DateTime(['%Y-%m']),
+  help='Also create the missing months from this one (YYYY-MM).')
+def create_partitions_command(ahead, since):
+  """Create the monthly partitions of shows up to --ahead months from now."""
+  with db.engine.begin() as connection:
+    created = partitions.ensure_partitions(connection, since=since, ahead=ahead)
+  click.echo(f'created {", ".join(created)}' if created else 'all partitions in place')
+
+@partitions_command.command('archive')
+@click.option('--before', required=True, type=click.DateTime(['%Y-%m']),
+  help='Archive the months before this one (YYYY-MM).')
+@click.option('--drop', is_flag=True, help='Drop the partitions instead of keeping them in the archive schema.')
+def archive_partitions_command(before, drop):
+  """Detach the partitions of shows older than --before."""
+  with db.engine.begin() as connection:
+    archived = partitions.archive_partitions(connection, before, drop)
+  if archived:
+    # the archived shows went without a flush to uncount them
+    show_counters.recount(db.session)
+    listing_versions.bump(db.session.connection(), LISTINGS)
+    db.session.commit()
+    page_cache.clear()
+  where = 'dropped' if drop else f'moved to the {partitions.ARCHIVE_SCHEMA} schema'
+  click.echo(f'{len(archived)} partitions {where}')
+
+@app.cli.group('jobs')
+def jobs_command():
+  """Run and inspect background jobs."""
+
+@jobs_command.command('work')
+@click.option('--threads', type=int, help='Jobs run at once; defaults to JOB_THREADS.')
+@click.option('--once', is_flag=True, help='Exit once no job is due.')
+def work_jobs_command(threads, once):
+  """Run due jobs until interrupted."""
+  stop = threading.Event()
+  def shut_down(signum, frame):
+    # finish the running jobs, claim no more
+    stop.set()
+    job_queue.wake()
+  signal.signal(signal.SIGTERM, shut_down)
+  signal.signal(signal.SIGINT, shut_down)
+  job_queue.work(threads or app.config['JOB_THREADS'], stop, once=once)
+
+@jobs_command.command('status')
+def jobs_status_command():
+  """Show the jobs by state, and the failed ones."""
+  for (state,), count in job_queue.depth().items():
+    click.echo(f'{state:8} {count}')
+  click.echo(f'oldest due job waiting {job_queue.oldest_due_seconds():.0f}s')
+  for job in Job.query.filter(Job.state == 'failed').order_by(Job.finished_at.desc()).limit(10):
+    last_line = (job.last_error or '').strip().splitlines()[-1:] or ['']
+    click.echo(f'failed {job.id} {job.name} at {job.finished_at:%Y-%m-%d %H:%M}: {last_line[0]}')
+
+@jobs_command.command('enqueue')
+@click.argument('name')
+@click.option('--payload', default='{}', help='Keyword arguments of the task, as a JSON object.')
+def enqueue_job_command(name, payload):
+  """Enqueue a job of the task NAME."""
+  if name not in job_queue.tasks:
+    raise click.BadParameter(f'one of {", ".join(sorted(job_queue.tasks))}', param_hint='NAME')
+  job = job_queue.enqueue(db.session, name, **json.loads(payload))
+  db.session.commit()
+  click.echo(f'enqueued job {job.id}')
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(importer.SPECS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+  help='Defaults to the file extension.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+  help='Write rejected rows to this file as NDJSON instead of stderr.')
+def import_command(kind, path, file_format, chunk_size, rejects):
+  """Bulk import venues, artists or shows from a CSV or NDJSON file.
+
+  Shows skip the booking conflict check of the show form: overlapping
+  shows of a venue or an artist are imported as they are.
+  """
+  report = importer.import_file(db.engine, db.metadata, kind, path, file_format, chunk_size)
+  if kind == 'shows':
+    # rows were written outside the session, so no flush counted them
+    show_counters.recount(db.session)
+  # nor bumped the listings or invalidated the cache
+  listing_versions.bump(db.session.connection(), LISTINGS)
+  db.session.commit()
+  page_cache.clear()
+
+  if rejects:
+    with open(rejects, 'w') as f:
+      for line_number, errors in report.rejected:
+        f.write(json.dumps({'line': line_number, 'errors': errors}) + '\n')
+  else:
+    for line_number, errors in report.rejected:
+      click.echo(f'line {line_number}: {errors}', err=True)
+  click.echo(f'{report.read} rows read, {report.inserted} inserted, {len(report.rejected)} rejected '
+    f'in {report.elapsed:.2f}s ({report.rows_per_second:.0f} rows/s)')
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(exporter.QUERIES)))
+@click.option('--format', 'file_format', type=click.Choice(sorted(exporter.FORMATS)),
+  default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w'), default='-', help='Defaults to stdout.')
+def export_command(kind, file_format, output):
+  """Stream shows, venues or artists out as CSV or NDJSON."""
+  for chunk in exporter.export(db.engine, db.metadata.tables, kind, file_format):
+    output.write(chunk)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,269 @@
+#----------------------------------------------------------------------------#
+# Async mode for the read routes.
+#
+#   uvicorn asgi:app --workers 4
+#
+# The listing, detail and search pages are served by Starlette views that
+# run their statements on an async SQLAlchemy engine, so a worker keeps
+# serving other requests while one waits on the database. A detail page
+# sends its four independent queries (the venue or artist, its genres, past
+# and upcoming shows) at once on separate pooled connections instead of
+# one after the other. Statements come from the same query builders as the
+# Flask views and pages are rendered from the same templates and view
+# models; every other route, writes included, is passed to the Flask app.
+#
+# Needs starlette, uvicorn, python-multipart and sqlalchemy[asyncio], plus
+# asyncpg or aiosqlite. The page cache, read replicas and request metrics
+# are not wired in here; benchmarks/throughput.py compares both modes.
+#----------------------------------------------------------------------------#
+
+import asyncio
+import contextlib
+from datetime import datetime
+try:
+  from starlette.applications import Starlette
+  from starlette.middleware.wsgi import WSGIMiddleware
+  from starlette.responses import HTMLResponse, PlainTextResponse
+  from starlette.routing import Mount, Route
+  from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:
+  raise RuntimeError('the async mode needs starlette, uvicorn, python-multipart and sqlalchemy[asyncio] installed')
+import flask
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+
+import app as fyyur
+import search
+from app import (Artist, ArtistGenre, MusicGenre, Show, Venue, VenueGenre,
+  ARTIST_COLUMNS, ARTIST_SEARCH_COLUMNS, ARTIST_SEARCH_GENRES, ARTIST_SHOW_COLUMNS,
+  VENUE_COLUMNS, VENUE_SEARCH_COLUMNS, VENUE_SEARCH_GENRES, VENUE_SHOW_COLUMNS)
+from pagination import keyset_page, keyset_query
+from view_models import ArtistPage, ArtistShow, ShowTile, VenuePage, VenueShow
+
+ASYNC_DRIVERS = {
+  'postgresql': 'postgresql+asyncpg',
+  'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(config):
+  if config['ASYNC_DATABASE_URL']:
+    return config['ASYNC_DATABASE_URL']
+  url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+  try:
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+  except KeyError:
+    raise RuntimeError(f'no async driver for {url.drivername}, set ASYNC_DATABASE_URL')
+
+
+def async_engine_options(config, url):
+  # the pool settings of db_pool.engine_options(); the async engine brings
+  # its own pool class
+  url = make_url(url)
+  options = {
+    'pool_size': config['DB_POOL_SIZE'],
+    'max_overflow': config['DB_MAX_OVERFLOW'],
+    'pool_timeout': config['DB_POOL_TIMEOUT'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+  }
+  if url.get_backend_name() == 'postgresql' and config['DB_STATEMENT_TIMEOUT_MS']:
+    options['connect_args'] = {'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT_MS'])}}
+  return options
+
+
+url = async_url(fyyur.app.config)
+engine = create_async_engine(url, **async_engine_options(fyyur.app.config, url))
+
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+async def fetch(statement):
+  # every call checks out its own connection, so fetches can be gathered
+  async with engine.connect() as connection:
+    return (await connection.execute(statement)).all()
+
+
+def build(builder, *args):
+  # query builders of app.py need the Flask app context for db.session
+  with fyyur.app.app_context():
+    return builder(*args)
+
+
+def render(request, template, status_code=200, **context):
+  # rendered by Flask's Jinja environment, filters and url_for included.
+  # The request context gets the client's headers so the template sees its
+  # Flask session (flashed messages), and the session is saved back onto
+  # the response once rendering consumed them.
+  flask_app = fyyur.app
+  with flask_app.test_request_context(request.url.path, method=request.method,
+      query_string=request.url.query, headers=list(request.headers.items())):
+    response = HTMLResponse(fyyur.render_template(template, **context), status_code=status_code)
+    saved = flask_app.response_class()
+    flask_app.session_interface.save_session(flask_app, flask.session, saved)
+    for cookie in saved.headers.getlist('Set-Cookie'):
+      response.headers.append('set-cookie', cookie)
+    return response
+
+
+def not_found(request):
+  return render(request, 'errors/404.html', status_code=404)
+
+
+def bad_request():
+  return PlainTextResponse('Bad Request', status_code=400)
+
+
+def paged(builder, *args, values, start=None):
+  # (statement for one page, sort key, after, before, per_page)
+  def statement():
+    query, columns = builder(*args)
+    after, before, per_page = fyyur.page_args(values, start)
+    return keyset_query(query, columns, after, before, per_page).statement, columns, after, before, per_page
+  return build(statement)
+
+
+def known_genre(genre):
+  return select(MusicGenre.name).where(MusicGenre.name == genre)
+
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+async def venues(request):
+  genre = request.path_params.get('genre')
+  try:
+    statement, columns, after, before, per_page = paged(fyyur.venues_query, genre, values=request.query_params)
+  except ValueError:
+    return bad_request()
+  if genre is None:
+    rows = await fetch(statement)
+  else:
+    rows, known = await asyncio.gather(fetch(statement), fetch(known_genre(genre)))
+    if not known:
+      return not_found(request)
+  page = keyset_page(rows, columns, after, before, per_page)
+  return render(request, 'pages/venues.html', areas=fyyur.venue_areas(page), page=page, genre=genre)
+
+
+async def artists(request):
+  genre = request.path_params.get('genre')
+  try:
+    statement, columns, after, before, per_page = paged(fyyur.artists_query, genre, values=request.query_params)
+  except ValueError:
+    return bad_request()
+  if genre is None:
+    rows = await fetch(statement)
+  else:
+    rows, known = await asyncio.gather(fetch(statement), fetch(known_genre(genre)))
+    if not known:
+      return not_found(request)
+  page = keyset_page(rows, columns, after, before, per_page)
+  return render(request, 'pages/artists.html', artists=page, page=page, genre=genre)
+
+
+async def shows(request):
+  try:
+    statement, columns, after, before, per_page = paged(fyyur.shows_query, values=request.query_params,
+      start=fyyur.shows_start())
+  except ValueError:
+    return bad_request()
+  page = keyset_page(await fetch(statement), columns, after, before, per_page)
+  data = [ShowTile._make(row) for row in page]
+  return render(request, 'pages/shows.html', shows=data, page=page)
+
+
+async def detail(owner_columns, owner_id, genre_column, genre_owner_id, shows):
+  # owner row, genres, past and upcoming shows, queried concurrently
+  now = datetime.now()
+  return await asyncio.gather(
+    fetch(select(*owner_columns).where(owner_columns[0] == owner_id)),
+    fetch(select(genre_column).where(genre_owner_id == owner_id).order_by(genre_column)),
+    fetch(shows.where(Show.start_time < now)),
+    fetch(shows.where(Show.start_time > now)))
+
+
+async def show_venue(request):
+  venue_id = request.path_params['venue_id']
+  shows = select(*VENUE_SHOW_COLUMNS).select_from(Show).join(Artist, Artist.id == Show.artist_id) \
+    .where(Show.venue_id == venue_id).order_by(Show.start_time)
+  owner, genres, past, upcoming = await detail(VENUE_COLUMNS, venue_id,
+    VenueGenre.genre, VenueGenre.venue_id, shows)
+  if not owner:
+    return not_found(request)
+  venue = VenuePage(*owner[0], genres=[genre for (genre,) in genres],
+    past_shows=[VenueShow._make(row) for row in past],
+    upcoming_shows=[VenueShow._make(row) for row in upcoming])
+  return render(request, 'pages/show_venue.html', venue=venue)
+
+
+async def show_artist(request):
+  artist_id = request.path_params['artist_id']
+  shows = select(*ARTIST_SHOW_COLUMNS).select_from(Show).join(Venue, Venue.id == Show.venue_id) \
+    .where(Show.artist_id == artist_id).order_by(Show.start_time)
+  owner, genres, past, upcoming = await detail(ARTIST_COLUMNS, artist_id,
+    ArtistGenre.genre, ArtistGenre.artist_id, shows)
+  if not owner:
+    return not_found(request)
+  artist = ArtistPage(*owner[0], genres=[genre for (genre,) in genres],
+    past_shows=[ArtistShow._make(row) for row in past],
+    upcoming_shows=[ArtistShow._make(row) for row in upcoming])
+  return render(request, 'pages/show_artist.html', artist=artist)
+
+
+async def search_page(request, model, columns, genres, template):
+  form = await request.form()
+  search_term = form.get('search_term', '')
+
+  def statements():
+    # search() reads the genre names, so it runs off the event loop
+    query, sort_key = search.search(fyyur.db.session, model, columns, search_term, genres=genres)
+    after, before, per_page = fyyur.page_args(form)
+    count = select(func.count()).select_from(query.statement.subquery())
+    return keyset_query(query, sort_key, after, before, per_page).statement, count, sort_key, after, before, per_page
+
+  try:
+    statement, count, sort_key, after, before, per_page = await asyncio.to_thread(build, statements)
+  except ValueError:
+    return bad_request()
+  rows, count = await asyncio.gather(fetch(statement), fetch(count))
+  page = keyset_page(rows, sort_key, after, before, per_page)
+  response = {
+    "count": count[0][0],
+    "data": page
+  }
+  return render(request, template, results=response, search_term=search_term, page=page)
+
+
+async def search_venues(request):
+  return await search_page(request, Venue, VENUE_SEARCH_COLUMNS, VENUE_SEARCH_GENRES,
+    'pages/search_venues.html')
+
+
+async def search_artists(request):
+  return await search_page(request, Artist, ARTIST_SEARCH_COLUMNS, ARTIST_SEARCH_GENRES,
+    'pages/search_artists.html')
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+  yield
+  await engine.dispose()
+
+
+app = Starlette(routes=[
+  Route('/venues', venues),
+  Route('/venues/genres/{genre}', venues),
+  Route('/venues/search', search_venues, methods=['POST']),
+  Route('/venues/{venue_id:int}', show_venue),
+  Route('/artists', artists),
+  Route('/artists/genres/{genre}', artists),
+  Route('/artists/search', search_artists, methods=['POST']),
+  Route('/artists/{artist_id:int}', show_artist),
+  Route('/shows', shows),
+  # everything else, writes included, is served by the Flask app
+  Mount('', WSGIMiddleware(fyyur.app)),
+], lifespan=lifespan)
@@ -0,0 +1,173 @@
+#----------------------------------------------------------------------------#
+# Synthetic catalog generator for the route benchmarks.
+#
+#   python benchmarks/catalog.py --db sqlite:////tmp/fyyur-bench.db --scale large
+#   python benchmarks/catalog.py --db postgresql://localhost/fyyur_bench \
+#     --venues 100000 --artists 100000 --shows 1000000
+#
+# The same seed always builds the same catalog. Rows are written in chunks
+# through importer.insert_rows (COPY on PostgreSQL, executemany elsewhere).
+# Show start times are spread evenly over four years around today, half
+# past and half upcoming, which also keeps the shows primary key unique.
+#----------------------------------------------------------------------------#
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+SCALES = {
+  'small': (1000, 1000, 10000),
+  'medium': (10000, 10000, 100000),
+  'large': (100000, 100000, 1000000),
+}
+
+CITIES = [
+  ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'), ('Brooklyn', 'NY'),
+  ('Chicago', 'IL'), ('Austin', 'TX'), ('Houston', 'TX'), ('Seattle', 'WA'), ('Portland', 'OR'),
+  ('Denver', 'CO'), ('Nashville', 'TN'), ('Memphis', 'TN'), ('New Orleans', 'LA'),
+  ('Atlanta', 'GA'), ('Miami', 'FL'), ('Boston', 'MA'), ('Philadelphia', 'PA'),
+  ('Detroit', 'MI'), ('Minneapolis', 'MN'), ('Phoenix', 'AZ'),
+]
+WORDS = [
+  'Blue', 'Velvet', 'Golden', 'Electric', 'Midnight', 'Crimson', 'Silver', 'Wild', 'Lost',
+  'Neon', 'Rusty', 'Copper', 'Hollow', 'Lucky', 'Echo', 'Lunar', 'Paper', 'Iron', 'Honey',
+  'Static', 'Sax', 'Piano', 'Owl', 'Fox', 'River', 'Harbor', 'Garden', 'Lantern', 'Room',
+]
+VENUE_KINDS = ['Hall', 'Club', 'Lounge', 'Bar', 'Theater', 'Cafe', 'Room', 'Stage']
+ARTIST_KINDS = ['Band', 'Trio', 'Quartet', 'Collective', 'Orchestra', 'Project', 'Ensemble']
+
+CHUNK_SIZE = 10000
+
+
+def name(rng, kinds, i):
+  return f'The {rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(kinds)} {i}'
+
+
+def venue_rows(rng, count):
+  for i in range(1, count + 1):
+    city, state = rng.choice(CITIES)
+    yield {
+      'id': i, 'name': name(rng, VENUE_KINDS, i), 'city': city, 'state': state,
+      'address': f'{rng.randint(1, 9999)} {rng.choice(WORDS)} Street',
+      'phone': f'{rng.randint(200, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+      'image_link': f'https://images.example.com/venues/{i}.jpg',
+      'facebook_link': f'https://www.facebook.com/venue{i}',
+      'website': f'https://venue{i}.example.com',
+      'seeking_talent': rng.random() < 0.3,
+      'seeking_description': None,
+    }
+
+
+def artist_rows(rng, count):
+  for i in range(1, count + 1):
+    city, state = rng.choice(CITIES)
+    yield {
+      'id': i, 'name': name(rng, ARTIST_KINDS, i), 'city': city, 'state': state,
+      'phone': f'{rng.randint(200, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+      'image_link': f'https://images.example.com/artists/{i}.jpg',
+      'facebook_link': f'https://www.facebook.com/artist{i}',
+      'website': None,
+      'seeking_venue': rng.random() < 0.3,
+      'seeking_description': None,
+    }
+
+
+def genre_rows(rng, key, count, genres):
+  for i in range(1, count + 1):
+    for genre in rng.sample(genres, rng.randint(1, 3)):
+      yield {key: i, 'genre': genre}
+
+
+# shows start two years either side of now
+SHOW_SPAN = timedelta(days=4 * 365)
+
+
+def show_rows(rng, count, venues, artists, now):
+  # evenly spaced, strictly increasing start times two years either side
+  # of now (whole seconds apart up to ~126M shows); one show in ten goes
+  # to the top 1% of venues so the busiest venue pages are measured too
+  step = SHOW_SPAN / count
+  begin = now - SHOW_SPAN / 2
+  for i in range(count):
+    yield {
+      'venue_id': rng.randint(1, max(1, venues // 100)) if rng.random() < 0.1 else rng.randint(1, venues),
+      'artist_id': rng.randint(1, artists),
+      'start_time': (begin + step * i).replace(microsecond=0),
+    }
+
+
+def chunks(rows, size=CHUNK_SIZE):
+  chunk = []
+  for row in rows:
+    chunk.append(row)
+    if len(chunk) >= size:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+
+def generate(url, venues, artists, shows, seed=0, echo=print):
+  os.environ['DATABASE_URL'] = url
+  from app import app, db, show_counters
+  from forms import Genre
+  import importer
+  import partitions
+
+  rng = random.Random(seed)
+  genres = [genre.value for genre in Genre]
+  now = datetime.now()
+  with app.app_context():
+    db.drop_all()
+    db.create_all()
+    if db.engine.dialect.name == 'postgresql':
+      # a monthly partition for every show, none in the default partition
+      with db.engine.begin() as connection:
+        partitions.ensure_partitions(connection, since=now - SHOW_SPAN / 2,
+          ahead=SHOW_SPAN.days // 2 // 28 + 1, now=now)
+    tables = db.metadata.tables
+    plan = [
+      ('venues', venue_rows(rng, venues)),
+      ('venue_genres', genre_rows(rng, 'venue_id', venues, genres)),
+      ('artists', artist_rows(rng, artists)),
+      ('artist_genres', genre_rows(rng, 'artist_id', artists, genres)),
+      ('shows', show_rows(rng, shows, venues, artists, now)),
+    ]
+    for table, rows in plan:
+      started = time.perf_counter()
+      written = 0
+      for chunk in chunks(rows):
+        with db.engine.begin() as connection:
+          importer.insert_rows(connection, tables[table], chunk)
+        written += len(chunk)
+      echo(f'{table}: {written} rows in {time.perf_counter() - started:.1f}s')
+    for table in ('venues', 'artists'):
+      importer.reset_id_sequence(db.engine, tables[table])
+    show_counters.recount(db.session)
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+      with db.engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--db', required=True, help='database URL, the database is wiped first')
+  parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+  parser.add_argument('--venues', type=int)
+  parser.add_argument('--artists', type=int)
+  parser.add_argument('--shows', type=int)
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  venues, artists, shows = SCALES[args.scale]
+  generate(args.db, args.venues or venues, args.artists or artists, args.shows or shows, args.seed)
+
+
+if __name__ == '__main__':
+  main()
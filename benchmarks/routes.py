@@ -0,0 +1,216 @@
+#----------------------------------------------------------------------------#
+# Route benchmarks.
+#
+#   python benchmarks/catalog.py --db sqlite:////tmp/fyyur-bench.db
+#   python benchmarks/routes.py --db sqlite:////tmp/fyyur-bench.db
+#
+# Drives every read route through the Flask test client and records, per
+# route, p50/p95 latency, the number of SQL statements one request sends
+# and the peak Python memory it allocates (tracemalloc, measured on a
+# separate request so tracing does not skew the timings). The page cache
+# is off unless --cache is given, so the numbers are the database work.
+#
+# Results are compared with a stored baseline (benchmarks/baseline.json);
+# the run exits 1 when a route sends more statements than it used to, or
+# its p50 or p95 latency or peak memory grew by more than --tolerance
+# (and, for latency, by more than MIN_REGRESSION_MS). Timings are only
+# compared when the baseline was taken on a catalog of the same size.
+# Write routes are left out, they would change the catalog between runs.
+#----------------------------------------------------------------------------#
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# latency differences below this many milliseconds are noise, not regressions
+MIN_REGRESSION_MS = 5.0
+
+
+def routes(app, db):
+  # (name, method, path, form data) for the routes of app.py, with ids
+  # and cursors picked from the catalog being measured
+  from app import Artist, Show, Venue, VenueGenre, encode_cursor
+
+  with app.app_context():
+    busiest = db.session.query(Show.venue_id).group_by(Show.venue_id) \
+      .order_by(db.func.count().desc(), Show.venue_id).limit(1).scalar()
+    artist = db.session.query(db.func.min(Artist.id)).scalar()
+    genre = db.session.query(VenueGenre.genre).order_by(VenueGenre.genre).limit(1).scalar()
+    total = Show.query.count()
+    middle = Show.query.order_by(Show.start_time, Show.venue_id, Show.artist_id) \
+      .offset(total // 2).first()
+    cursor = encode_cursor([middle.start_time, middle.venue_id, middle.artist_id]) if middle else ''
+    db.session.close()
+
+  return [
+    ('index', 'GET', '/', None),
+    ('venues', 'GET', '/venues', None),
+    ('venues_genre', 'GET', f'/venues/genres/{genre}', None),
+    ('venue', 'GET', f'/venues/{busiest}', None),
+    ('venue_calendar', 'GET', f'/venues/{busiest}/calendar', None),
+    ('venue_edit', 'GET', f'/venues/{busiest}/edit', None),
+    ('venue_create', 'GET', '/venues/create', None),
+    ('venues_search', 'POST', '/venues/search', {'search_term': 'hall'}),
+    ('venues_search_short', 'POST', '/venues/search', {'search_term': 'ca'}),
+    ('venues_typeahead', 'GET', '/venues/typeahead?q=the b', None),
+    ('artists', 'GET', '/artists', None),
+    ('artists_genre', 'GET', f'/artists/genres/{genre}', None),
+    ('artist', 'GET', f'/artists/{artist}', None),
+    ('artist_calendar', 'GET', f'/artists/{artist}/calendar', None),
+    ('artist_edit', 'GET', f'/artists/{artist}/edit', None),
+    ('artist_create', 'GET', '/artists/create', None),
+    ('artists_search', 'POST', '/artists/search', {'search_term': 'jazz'}),
+    ('artists_typeahead', 'GET', '/artists/typeahead?q=b', None),
+    ('shows', 'GET', '/shows', None),
+    ('shows_middle', 'GET', f'/shows?after={cursor}', None),
+    ('show_create', 'GET', '/shows/create', None),
+    ('export_venues', 'GET', '/export/venues.csv', None),
+    ('export_shows', 'GET', '/export/shows.ndjson', None),
+  ]
+
+
+def percentile(samples, fraction):
+  ordered = sorted(samples)
+  return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(client, engine, method, path, data, iterations, warmup=2):
+  from sqlalchemy import event
+
+  def request():
+    response = client.open(path, method=method, data=data)
+    response.get_data()  # drain streamed bodies
+    if response.status_code != 200:
+      raise RuntimeError(f'{method} {path}: HTTP {response.status_code}')
+
+  for _ in range(warmup):
+    request()
+
+  timings = []
+  for _ in range(iterations):
+    started = time.perf_counter()
+    request()
+    timings.append((time.perf_counter() - started) * 1000)
+
+  statements = []
+  count = lambda *args: statements.append(1)
+  event.listen(engine, 'before_cursor_execute', count)
+  tracemalloc.start()
+  try:
+    request()
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+    event.remove(engine, 'before_cursor_execute', count)
+
+  return {
+    'p50_ms': round(statistics.median(timings), 2),
+    'p95_ms': round(percentile(timings, 0.95), 2),
+    'statements': len(statements),
+    'peak_kib': round(peak / 1024, 1),
+  }
+
+
+def catalog_size(app, db):
+  from app import Artist, Show, Venue
+  with app.app_context():
+    size = {'venues': Venue.query.count(), 'artists': Artist.query.count(), 'shows': Show.query.count()}
+    db.session.close()
+  return size
+
+
+def compare(results, baseline, tolerance, timings=True):
+  # returns a list of regression messages
+  regressions = []
+  for name, result in results.items():
+    before = baseline.get(name)
+    if before is None:
+      continue
+    if result['statements'] > before['statements']:
+      regressions.append(f"{name}: {result['statements']} statements, was {before['statements']}")
+    if not timings:
+      continue
+    slower = [p for p in ('p50_ms', 'p95_ms')
+      if result[p] > max(before[p] * (1 + tolerance), before[p] + MIN_REGRESSION_MS)]
+    if slower:
+      regressions.append(f"{name}: p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms, "
+        f"was {before['p50_ms']}ms {before['p95_ms']}ms")
+    if result['peak_kib'] > before['peak_kib'] * (1 + tolerance):
+      regressions.append(f"{name}: peak memory {result['peak_kib']}KiB, was {before['peak_kib']}KiB")
+  return regressions
+
+
+def run(url, iterations=30, cache=False, only=None, echo=print):
+  os.environ['DATABASE_URL'] = url
+  # runner threads would poll the database in the middle of the timings
+  os.environ['JOB_RUNNER'] = 'worker'
+  from app import app, db, page_cache
+
+  app.config['WTF_CSRF_ENABLED'] = False
+  if not cache:
+    page_cache.backend = None
+
+  results = {}
+  client = app.test_client()
+  with app.app_context():
+    engine = db.engine
+  for name, method, path, data in routes(app, db):
+    if only and name not in only:
+      continue
+    results[name] = measure(client, engine, method, path, data, iterations)
+    r = results[name]
+    echo(f"{name:<22} p50 {r['p50_ms']:>9.2f}ms  p95 {r['p95_ms']:>9.2f}ms  "
+         f"{r['statements']:>3} statements  peak {r['peak_kib']:>10.1f}KiB")
+  return {'dialect': engine.dialect.name, 'catalog': catalog_size(app, db), 'routes': results}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--db', required=True, help='database URL of a generated catalog')
+  parser.add_argument('--iterations', type=int, default=30)
+  parser.add_argument('--cache', action='store_true', help='keep the page cache on')
+  parser.add_argument('--route', action='append', dest='only', help='only run this route, repeatable')
+  parser.add_argument('--baseline', default=BASELINE)
+  parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative growth (0.25 = 25%%)')
+  parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+  parser.add_argument('--output', help='also write the results to this JSON file')
+  args = parser.parse_args()
+
+  report = run(args.db, args.iterations, args.cache, args.only)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  if args.save_baseline:
+    with open(args.baseline, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+      f.write('\n')
+    print(f'baseline written to {args.baseline}')
+    return
+
+  if not os.path.exists(args.baseline):
+    print(f'no baseline at {args.baseline}, run with --save-baseline first')
+    return
+  with open(args.baseline) as f:
+    baseline = json.load(f)
+  timings = baseline['catalog'] == report['catalog'] and baseline['dialect'] == report['dialect']
+  if not timings:
+    print(f"baseline was taken on {baseline['dialect']} {baseline['catalog']}, "
+          'comparing statement counts only')
+  regressions = compare(report['routes'], baseline['routes'], args.tolerance, timings)
+  for regression in regressions:
+    print(f'REGRESSION {regression}')
+  if regressions:
+    sys.exit(1)
+  print('no regressions against the baseline')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,179 @@
+#----------------------------------------------------------------------------#
+# Throughput of the sync and async serving modes.
+#
+#   python benchmarks/catalog.py --db sqlite:////tmp/fyyur-bench.db
+#   python benchmarks/throughput.py --db sqlite:////tmp/fyyur-bench.db
+#
+# Starts the app with one worker process in each mode (gunicorn with
+# --threads for app.py, uvicorn for asgi.py), keeps --concurrency
+# keep-alive clients busy on the read routes the async mode serves for
+# --duration seconds, and reports requests per second, latency and the
+# server's CPU time. One worker is one core, so requests per CPU second is
+# the throughput per core; the CPU time covers the server's whole life,
+# start-up and warm-up included. The page cache is off in both modes.
+#
+# The clients run in this process; on a machine with few cores they
+# compete with the server, run them elsewhere with --url against a server
+# started by hand.
+#----------------------------------------------------------------------------#
+
+import argparse
+import http.client
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from routes import percentile, routes
+
+# the routes of benchmarks/routes.py that asgi.py serves itself
+READ_ROUTES = ('venues', 'venues_genre', 'venue', 'venues_search', 'venues_search_short',
+  'artists', 'artists_genre', 'artist', 'artists_search', 'shows', 'shows_middle')
+
+
+def server_command(mode, port, threads):
+  if mode == 'sync':
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', '1',
+      '--threads', str(threads), '--bind', f'127.0.0.1:{port}', 'app:app']
+  return [sys.executable, '-m', 'uvicorn', '--workers', '1', '--host', '127.0.0.1',
+    '--port', str(port), '--no-access-log', 'asgi:app']
+
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+def wait_until_up(port, server, timeout=30):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if server.poll() is not None:
+      raise RuntimeError(f'server exited with status {server.returncode}')
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return
+    except OSError:
+      time.sleep(0.2)
+  raise RuntimeError(f'server did not listen on port {port} within {timeout}s')
+
+
+def load(host, port, requests, duration, concurrency):
+  # (latencies in seconds, errors) of every request sent in `duration`
+  latencies = []
+  errors = []
+  deadline = time.monotonic() + duration
+
+  def client(seed):
+    pick = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    own = []
+    failed = 0
+    while time.monotonic() < deadline:
+      name, method, path, data = pick.choice(requests)
+      body = urlencode(data) if data else None
+      headers = {'Content-Type': 'application/x-www-form-urlencoded'} if data else {}
+      started = time.perf_counter()
+      try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+          failed += 1
+      except (OSError, http.client.HTTPException):
+        failed += 1
+        connection.close()
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        continue
+      own.append(time.perf_counter() - started)
+    connection.close()
+    latencies.extend(own)
+    errors.append(failed)
+
+  clients = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+  for thread in clients:
+    thread.start()
+  for thread in clients:
+    thread.join()
+  return latencies, sum(errors)
+
+
+def run_mode(mode, url, requests, duration, concurrency, threads, warmup=2.0):
+  port = free_port()
+  env = dict(os.environ, DATABASE_URL=url, FYYUR_ENV='production', CACHE_ENABLED='0',
+    JOB_RUNNER='worker', SECRET_KEY='throughput-benchmark')
+  server = subprocess.Popen(server_command(mode, port, threads), cwd=ROOT, env=env,
+    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  try:
+    wait_until_up(port, server)
+    load('127.0.0.1', port, requests, warmup, concurrency)
+    latencies, errors = load('127.0.0.1', port, requests, duration, concurrency)
+  finally:
+    server.send_signal(signal.SIGTERM)
+  # the rusage of the server and the worker processes it waited for
+  _, _, usage = os.wait4(server.pid, 0)
+  return latencies, errors, usage.ru_utime + usage.ru_stime
+
+
+def report(mode, latencies, errors, duration, cpu_seconds=None):
+  count = len(latencies)
+  line = {
+    'mode': mode,
+    'requests': count,
+    'errors': errors,
+    'rps': count / duration,
+    'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+    'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else 0.0,
+  }
+  if cpu_seconds is not None:
+    line['cpu_s'] = cpu_seconds
+    line['per_cpu_s'] = count / cpu_seconds if cpu_seconds else 0.0
+  return line
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--db', required=True, help='database URL of a generated catalog')
+  parser.add_argument('--mode', action='append', choices=('sync', 'async'),
+    help='serving mode to measure, repeatable (default: both)')
+  parser.add_argument('--url', help='load a running server at this base URL instead')
+  parser.add_argument('--duration', type=float, default=15.0, help='seconds of load per mode')
+  parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+  parser.add_argument('--threads', type=int, default=8, help='gunicorn threads in sync mode')
+  args = parser.parse_args()
+
+  os.environ['DATABASE_URL'] = args.db
+  from app import app, db
+  requests = [route for route in routes(app, db) if route[0] in READ_ROUTES]
+
+  results = []
+  if args.url:
+    target = urlsplit(args.url)
+    latencies, errors = load(target.hostname, target.port or 80, requests, args.duration, args.concurrency)
+    results.append(report(args.url, latencies, errors, args.duration))
+  else:
+    for mode in args.mode or ('sync', 'async'):
+      latencies, errors, cpu_seconds = run_mode(mode, args.db, requests, args.duration,
+        args.concurrency, args.threads)
+      results.append(report(mode, latencies, errors, args.duration, cpu_seconds))
+
+  print(f'{"mode":<24} {"requests":>9} {"errors":>7} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+    f'{"cpu s":>7} {"req/cpu s":>10}')
+  for line in results:
+    cpu = f'{line["cpu_s"]:>7.1f} {line["per_cpu_s"]:>10.1f}' if 'cpu_s' in line else f'{"-":>7} {"-":>10}'
+    print(f'{line["mode"]:<24} {line["requests"]:>9} {line["errors"]:>7} {line["rps"]:>8.1f} '
+      f'{line["p50_ms"]:>8.1f} {line["p95_ms"]:>8.1f} {cpu}')
+  return 1 if any(line['errors'] for line in results) else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
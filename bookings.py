@@ -0,0 +1,76 @@
+#----------------------------------------------------------------------------#
+# Booking conflicts.
+#
+# Shows have no end time: each one is taken to hold its venue and its
+# artist for BOOKING_LENGTH_MINUTES from its start. Two shows of the same
+# venue, or of the same artist, conflict when they start less than that
+# apart. Finding the conflicts of a new show, or of a whole weekly or
+# monthly series of them, is one query: an OR of a window around each
+# start time, for the venue and for the artist, every one a bounded range
+# scan of the (venue_id, start_time) or (artist_id, start_time) index of
+# shows. Only the shows that do conflict come back.
+#
+# On PostgreSQL the check and the insert run under transaction scoped
+# advisory locks on the venue and the artist, so two bookings racing for
+# the same slot cannot both pass the check. An exclusion constraint would
+# have to include start_time by equality on the partitioned shows table
+# (see partitions.py), which rules it out.
+#----------------------------------------------------------------------------#
+
+import bisect
+import itertools
+from datetime import datetime
+from dateutil import rrule
+from sqlalchemy import func, or_, select
+
+# advisory lock key spaces
+VENUE_LOCK = 1
+ARTIST_LOCK = 2
+
+FREQUENCIES = {
+  'weekly': rrule.WEEKLY,
+  'monthly': rrule.MONTHLY,
+}
+
+
+def occurrences(start_time, repeat=None, count=None, until=None, limit=None):
+  # the start times of a show repeated weekly or monthly, `count` times or
+  # through the day `until`, whichever ends first; at most limit + 1 of
+  # them, so a caller can tell a series that is too long. Monthly series
+  # skip the months without the first show's day (RFC 5545).
+  if not repeat:
+    return [start_time]
+  if until is not None:
+    until = datetime.combine(until, datetime.max.time())
+  rule = rrule.rrule(FREQUENCIES[repeat], dtstart=start_time, count=count, until=until)
+  return list(itertools.islice(rule, None if limit is None else limit + 1))
+
+
+def lock(session, venue_id, artist_id):
+  # held until the transaction ends; venue first, always, so bookings
+  # waiting on each other cannot deadlock
+  if session.get_bind().dialect.name == 'postgresql':
+    session.execute(select(func.pg_advisory_xact_lock(VENUE_LOCK, venue_id),
+      func.pg_advisory_xact_lock(ARTIST_LOCK, artist_id)))
+
+
+def conflicts(session, show, venue_id, artist_id, start_times, length):
+  # {start time: (venue_id, artist_id, start_time) of the shows it would
+  # overlap, in start time order} for the given start times of a venue and
+  # artist; start times without conflicts are left out
+  windows = [(show.start_time > start_time - length) & (show.start_time < start_time + length)
+    for start_time in start_times]
+  rows = session.execute(select(show.venue_id, show.artist_id, show.start_time).where(or_(
+    *[(show.venue_id == venue_id) & window for window in windows],
+    *[(show.artist_id == artist_id) & window for window in windows])
+  ).order_by(show.start_time)).all()
+
+  # the start times within `length` of each conflicting show
+  ordered = sorted(start_times)
+  found = {}
+  for row in rows:
+    first = bisect.bisect_right(ordered, row.start_time - length)
+    last = bisect.bisect_left(ordered, row.start_time + length)
+    for start_time in ordered[first:last]:
+      found.setdefault(start_time, []).append(row)
+  return {start_time: found[start_time] for start_time in start_times if start_time in found}
@@ -0,0 +1,306 @@
+#----------------------------------------------------------------------------#
+# Read-through page cache.
+#
+# Rendered GET pages are cached by path and query string, with the headers
+# the view gave them (the calendars are JSON), each entry tagged with the
+# entities it shows ("venue:3", "artist:6", "shows", ...). Commits
+# invalidate exactly the tags of the rows they inserted, updated or deleted,
+# collected from SQLAlchemy session events. Entries also expire after a
+# TTL, which bounds how long a show can stay listed as upcoming after it
+# started. The memory backend is per process; use the redis backend when
+# several workers must see each other's invalidations.
+#
+# Below the page cache, FragmentCache keeps rendered template fragments
+# ({% cache 'name', id, updated_at %}...{% endcache %}) in a bounded LRU.
+# Keys carry the updated_at of what the fragment shows, so an edit simply
+# makes new keys and the stale entries age out.
+#----------------------------------------------------------------------------#
+
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timezone
+from functools import wraps
+from flask import g, has_app_context, make_response, request, session
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+
+
+class MemoryCache:
+  # LRU ordered dict of key -> (expires_at, value, tags)
+  def __init__(self, max_entries=1024, default_ttl=60):
+    self.max_entries = max_entries
+    self.default_ttl = default_ttl
+    self._entries = OrderedDict()
+    self._keys_by_tag = defaultdict(set)
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      if entry[0] < time.monotonic():
+        self._remove(key)
+        return None
+      self._entries.move_to_end(key)
+      return entry[1]
+
+  def set(self, key, value, tags=(), ttl=None):
+    expires_at = time.monotonic() + (ttl or self.default_ttl)
+    with self._lock:
+      if key in self._entries:
+        self._remove(key)
+      self._entries[key] = (expires_at, value, frozenset(tags))
+      for tag in tags:
+        self._keys_by_tag[tag].add(key)
+      while len(self._entries) > self.max_entries:
+        self._remove(next(iter(self._entries)))
+
+  def invalidate(self, tags):
+    with self._lock:
+      for tag in tags:
+        for key in list(self._keys_by_tag.get(tag, ())):
+          self._remove(key)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._keys_by_tag.clear()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def _remove(self, key):
+    _, _, tags = self._entries.pop(key)
+    for tag in tags:
+      keys = self._keys_by_tag.get(tag)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self._keys_by_tag[tag]
+
+
+class RedisCache:
+  # eviction is left to the server's maxmemory-policy (allkeys-lru)
+  def __init__(self, url, default_ttl=60, prefix='fyyur:cache:'):
+    try:
+      import redis
+    except ImportError:
+      raise RuntimeError('CACHE_BACKEND = "redis" needs the redis package installed')
+    self.client = redis.Redis.from_url(url)
+    self.default_ttl = default_ttl
+    self.prefix = prefix
+
+  def get(self, key):
+    value = self.client.get(self.prefix + key)
+    return None if value is None else pickle.loads(value)
+
+  def set(self, key, value, tags=(), ttl=None):
+    ttl = ttl or self.default_ttl
+    pipe = self.client.pipeline()
+    pipe.setex(self.prefix + key, ttl, pickle.dumps(value))
+    for tag in tags:
+      tag_key = self.prefix + 'tag:' + tag
+      pipe.sadd(tag_key, key)
+      pipe.expire(tag_key, ttl)
+    pipe.execute()
+
+  def invalidate(self, tags):
+    for tag in tags:
+      tag_key = self.prefix + 'tag:' + tag
+      keys = [self.prefix + k.decode('utf-8') for k in self.client.smembers(tag_key)]
+      self.client.delete(tag_key, *keys)
+
+  def clear(self):
+    for key in self.client.scan_iter(self.prefix + '*'):
+      self.client.delete(key)
+
+
+class PageCache:
+  def __init__(self, app=None, tags_for=None, variant=None):
+    self.backend = None
+    self.tags_for = tags_for
+    # () -> a prefix of the current request's key, None to bypass the cache
+    self.variant = variant
+    self.hits = 0
+    self.misses = 0
+    # bumped on every invalidation so a page rendered from rows read before
+    # a concurrent commit is not stored after that commit invalidated it
+    self._generation = 0
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    if not app.config['CACHE_ENABLED']:
+      return
+    if app.config['CACHE_BACKEND'] == 'redis':
+      self.backend = RedisCache(app.config['CACHE_REDIS_URL'], app.config['CACHE_DEFAULT_TTL'])
+    else:
+      self.backend = MemoryCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_DEFAULT_TTL'])
+
+  def watch(self, session_class):
+    # collect the tags of everything a flush writes, invalidate on commit
+    @event.listens_for(session_class, 'after_flush')
+    def collect_tags(db_session, flush_context):
+      tags = db_session.info.setdefault('cache_tags', set())
+      for instance in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        tags.update(self.tags_for(instance))
+
+    @event.listens_for(session_class, 'after_commit')
+    def invalidate_tags(db_session):
+      tags = db_session.info.pop('cache_tags', None)
+      if tags:
+        self.invalidate(tags)
+
+    @event.listens_for(session_class, 'after_rollback')
+    def discard_tags(db_session):
+      db_session.info.pop('cache_tags', None)
+
+  def stage(self, db_session, tags):
+    # tags of rows written without a flush (Core statements), invalidated
+    # with the rest when db_session commits
+    db_session.info.setdefault('cache_tags', set()).update(tags)
+
+  def invalidate(self, tags):
+    self._generation += 1
+    if self.backend is not None:
+      self.backend.invalidate(tags)
+
+  def clear(self):
+    self._generation += 1
+    if self.backend is not None:
+      self.backend.clear()
+
+  def cached(self, view):
+    # decorator for GET views; the view tags its page with add_tags()
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      # pending flash messages are rendered into (and consumed by) the page
+      if self.backend is None or '_flashes' in session:
+        return view(*args, **kwargs)
+
+      variant = self.variant() if self.variant is not None else ''
+      if variant is None:
+        return view(*args, **kwargs)
+      key = variant + request.full_path
+      entry = self.backend.get(key)
+      if entry is not None:
+        self.hits += 1
+        body, headers = entry
+        return make_response(body, headers)
+      self.misses += 1
+
+      generation = self._generation
+      g.cache_tags = set()
+      response = make_response(view(*args, **kwargs))
+      if response.status_code == 200 and generation == self._generation:
+        self.backend.set(key, (response.get_data(), list(response.headers)), g.cache_tags)
+      return response
+    return wrapper
+
+
+def add_tags(*tags):
+  # called from a cached view to tag the page it is rendering
+  if 'cache_tags' in g:
+    g.cache_tags.update(tags)
+
+
+def conditional(validators):
+  # decorator for GET views answering If-None-Match / If-Modified-Since.
+  # `validators` takes the view arguments and returns (last_modified, state)
+  # from a cheap query, or None when the page does not exist; `state` is
+  # anything whose repr changes whenever the page does.
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if '_flashes' in session:
+        return view(*args, **kwargs)
+      result = validators(*args, **kwargs)
+      if result is None:
+        return view(*args, **kwargs)
+
+      last_modified, state = result
+      etag = hashlib.sha1(repr((request.full_path, state)).encode('utf-8')).hexdigest()
+      if last_modified is not None:
+        # naive datetimes in this app are local time
+        last_modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+
+      if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+      else:
+        not_modified = (request.if_modified_since is not None and last_modified is not None
+          and last_modified <= request.if_modified_since)
+
+      response = make_response(('', 304) if not_modified else view(*args, **kwargs))
+      if response.status_code in (200, 304):
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+      return response
+    return wrapper
+  return decorator
+
+
+class FragmentCacheExtension(Extension):
+  # {% cache 'show-tile', show.id, show.updated_at %} ... {% endcache %}
+  tags = {'cache'}
+
+  def __init__(self, environment):
+    super().__init__(environment)
+    environment.extend(fragment_cache=None)
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    key = [parser.parse_expression()]
+    while parser.stream.skip_if('comma'):
+      key.append(parser.parse_expression())
+    body = parser.parse_statements(['name:endcache'], drop_needle=True)
+    return nodes.CallBlock(self.call_method('_cached', [nodes.List(key)]), [], [], body).set_lineno(lineno)
+
+  def _cached(self, key, caller):
+    cache = self.environment.fragment_cache
+    return caller() if cache is None else cache.fetch(key, caller)
+
+
+class FragmentCache:
+  def __init__(self, app=None):
+    self.backend = None
+    self.hits = 0
+    self.misses = 0
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = self
+    if app.config['FRAGMENT_CACHE_ENABLED']:
+      self.backend = MemoryCache(app.config['FRAGMENT_CACHE_MAX_ENTRIES'], app.config['FRAGMENT_CACHE_TTL'])
+    app.after_request(self.report)
+
+  def fetch(self, key, render):
+    if self.backend is None:
+      return render()
+    key = repr(key)
+    fragment = self.backend.get(key)
+    hit = fragment is not None
+    if hit:
+      self.hits += 1
+    else:
+      self.misses += 1
+      fragment = render()
+      self.backend.set(key, fragment)
+    if has_app_context():
+      counts = g.setdefault('fragment_counts', [0, 0])
+      counts[0 if hit else 1] += 1
+    return fragment
+
+  def report(self, response):
+    # hits and misses of this render, next to the metrics' Server-Timing
+    counts = g.pop('fragment_counts', None)
+    if counts is not None:
+      response.headers.add('Server-Timing', f'fragments;desc="{counts[0]} hits, {counts[1]} misses"')
+    return response
@@ -0,0 +1,153 @@
+#----------------------------------------------------------------------------#
+# Denormalized show counters.
+#
+# venues and artists carry upcoming_shows_count and past_shows_count so
+# the listings never touch shows. The split between upcoming and past is
+# taken at the reconciled_at watermark of the single show_counts_state
+# row, not at the current time: a show counts as upcoming while its start
+# time is after the watermark.
+#
+# Flushes adjust the counters in the same transaction as the shows they
+# add or delete, deleted venues and artists included; set-based deletes
+# of venues and artists call forget() before their DELETE. `flask
+# reconcile-show-counts`, run every few minutes, moves the shows that
+# started since the last run over to the past counts and advances the
+# watermark; with --recount it rebuilds every counter from the shows
+# table, after bulk imports or to repair drift.
+#
+# Flushes read the watermark with a shared lock and the reconciler
+# updates it with an exclusive one (PostgreSQL), so a show committed
+# while a reconciliation runs is never counted on the wrong side.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+import dateutil.parser
+from sqlalchemy import event, func, select, update
+
+
+class ShowCounters:
+  def __init__(self, show, venue, artist, state):
+    self.shows = show.__table__
+    self.venues = venue.__table__
+    self.artists = artist.__table__
+    self.state = state.__table__
+    self.show_class, self.venue_class, self.artist_class = show, venue, artist
+
+  def watch(self, session_class):
+    @event.listens_for(session_class, 'before_flush')
+    def count_shows(db_session, flush_context, instances):
+      self.count_flush(db_session)
+
+  def watermark(self, connection, exclusive=False):
+    query = select(self.state.c.reconciled_at).with_for_update(read=not exclusive)
+    return connection.execute(query).scalar_one()
+
+  def count_flush(self, db_session):
+    added = [i for i in db_session.new if isinstance(i, self.show_class)]
+    removed = [i for i in db_session.deleted if isinstance(i, self.show_class)]
+    venues = {i.id for i in db_session.deleted if isinstance(i, self.venue_class)}
+    artists = {i.id for i in db_session.deleted if isinstance(i, self.artist_class)}
+    if not (added or removed or venues or artists):
+      return
+
+    connection = db_session.connection()
+    watermark = self.watermark(connection)
+    # (table, id) -> [upcoming, past]
+    deltas = {}
+    for show in added:
+      upcoming = start_time(show) > watermark
+      count(deltas, self.venues, show.venue_id, upcoming, 1)
+      count(deltas, self.artists, show.artist_id, upcoming, 1)
+    for show in removed:
+      # shows of a deleted venue or artist are subtracted below
+      upcoming = start_time(show) > watermark
+      if show.venue_id not in venues and show.artist_id not in artists:
+        count(deltas, self.venues, show.venue_id, upcoming, -1)
+        count(deltas, self.artists, show.artist_id, upcoming, -1)
+
+    self.apply(connection, deltas)
+    self.subtract_owners(connection, watermark, venues, artists)
+
+  def forget(self, db_session, venue_ids=(), artist_ids=()):
+    # for venues and artists deleted without the ORM (their shows go by ON
+    # DELETE CASCADE), before their DELETE. Returns the (venue ids, artist
+    # ids) whose counts changed. The caller commits.
+    connection = db_session.connection()
+    return self.subtract_owners(connection, self.watermark(connection), set(venue_ids), set(artist_ids))
+
+  def subtract_owners(self, connection, watermark, venues, artists):
+    # the shows of deleted venues leave their artists' counts, and the
+    # other way round, one UPDATE per side; returns the (venue ids, artist
+    # ids) whose counts changed, their pages listed the deleted shows
+    changed = {self.venues: set(), self.artists: set()}
+    for owner_column, other_column, owners, others, other_table in (
+        (self.shows.c.venue_id, self.shows.c.artist_id, venues, artists, self.artists),
+        (self.shows.c.artist_id, self.shows.c.venue_id, artists, venues, self.venues)):
+      if not owners:
+        continue
+      gone = select(func.count()).where(other_column == other_table.c.id, owner_column.in_(owners))
+      rows = connection.execute(update(other_table).where(
+        other_table.c.id.in_(select(other_column).where(owner_column.in_(owners))),
+        other_table.c.id.not_in(others)
+      ).values(
+        upcoming_shows_count=other_table.c.upcoming_shows_count -
+          gone.where(self.shows.c.start_time > watermark).scalar_subquery(),
+        past_shows_count=other_table.c.past_shows_count -
+          gone.where(self.shows.c.start_time <= watermark).scalar_subquery(),
+        updated_at=other_table.c.updated_at
+      ).returning(other_table.c.id))
+      changed[other_table].update(other_id for (other_id,) in rows)
+    return changed[self.venues], changed[self.artists]
+
+  def apply(self, connection, deltas):
+    for (table, owner_id), (upcoming, past) in deltas.items():
+      if upcoming or past:
+        connection.execute(update(table).where(table.c.id == owner_id).values(
+          upcoming_shows_count=table.c.upcoming_shows_count + upcoming,
+          past_shows_count=table.c.past_shows_count + past,
+          # counters are not an edit of the venue or artist
+          updated_at=table.c.updated_at))
+
+  def reconcile(self, db_session, now=None):
+    # moves shows that started since the last run from the upcoming to the
+    # past counts; returns how many shows moved. The caller commits.
+    now = now or datetime.now()
+    connection = db_session.connection()
+    watermark = self.watermark(connection, exclusive=True)
+    if now <= watermark:
+      return 0
+    passed = (self.shows.c.start_time > watermark) & (self.shows.c.start_time <= now)
+    for table, owner_column in ((self.venues, self.shows.c.venue_id), (self.artists, self.shows.c.artist_id)):
+      moved = select(func.count()).where(owner_column == table.c.id, passed).scalar_subquery()
+      connection.execute(update(table).where(table.c.id.in_(select(owner_column).where(passed))).values(
+        upcoming_shows_count=table.c.upcoming_shows_count - moved,
+        past_shows_count=table.c.past_shows_count + moved,
+        updated_at=table.c.updated_at))
+    moved = connection.execute(select(func.count()).select_from(self.shows).where(passed)).scalar()
+    connection.execute(update(self.state).values(reconciled_at=now))
+    return moved
+
+  def recount(self, db_session, now=None):
+    # rebuilds every counter from the shows table. The caller commits.
+    now = now or datetime.now()
+    connection = db_session.connection()
+    self.watermark(connection, exclusive=True)
+    for table, owner_column in ((self.venues, self.shows.c.venue_id), (self.artists, self.shows.c.artist_id)):
+      shows = select(func.count()).where(owner_column == table.c.id)
+      connection.execute(update(table).values(
+        upcoming_shows_count=shows.where(self.shows.c.start_time > now).scalar_subquery(),
+        past_shows_count=shows.where(self.shows.c.start_time <= now).scalar_subquery(),
+        updated_at=table.c.updated_at))
+    connection.execute(update(self.state).values(reconciled_at=now))
+
+
+def count(deltas, table, owner_id, upcoming, n):
+  delta = deltas.setdefault((table, owner_id), [0, 0])
+  delta[0 if upcoming else 1] += n
+
+
+def start_time(show):
+  # forms post start times as text
+  if isinstance(show.start_time, str):
+    return dateutil.parser.parse(show.start_time)
+  return show.start_time
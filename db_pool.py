@@ -0,0 +1,97 @@
+#----------------------------------------------------------------------------#
+# Database engine options and connection pool metrics.
+#
+# engine_options() turns the DB_* settings of config.py into engine
+# options, for SQLALCHEMY_ENGINE_OPTIONS and each SQLALCHEMY_BINDS entry
+# (Flask-SQLAlchemy does not apply the former to binds). The pool is a
+# QueuePool that also records how long each checkout waited for a free
+# connection, so pool exhaustion shows up on /metrics before it shows up
+# as timeouts. Engines must not cross a fork: gunicorn.conf.py disposes
+# the preloaded engines in every worker.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+from metrics import Histogram
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class TimedQueuePool(QueuePool):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.waits = Histogram('fyyur_db_pool_wait_seconds',
+      'Time spent waiting for a pooled connection.', WAIT_BUCKETS, ())
+    self.timeouts = 0
+    self._timeouts_lock = threading.Lock()
+
+  def _do_get(self):
+    started = time.perf_counter()
+    try:
+      return super()._do_get()
+    except TimeoutError:
+      with self._timeouts_lock:
+        self.timeouts += 1
+      raise
+    finally:
+      self.waits.observe(time.perf_counter() - started)
+
+  def recreate(self):
+    # dispose() swaps in a new pool; keep the counts across it
+    pool = super().recreate()
+    pool.waits, pool.timeouts = self.waits, self.timeouts
+    return pool
+
+
+def engine_options(config, url):
+  url = make_url(url)
+  if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+    # in-memory databases live in a single connection, keep SQLAlchemy's pool
+    return {}
+
+  options = {
+    'poolclass': TimedQueuePool,
+    'pool_size': config['DB_POOL_SIZE'],
+    'max_overflow': config['DB_MAX_OVERFLOW'],
+    'pool_timeout': config['DB_POOL_TIMEOUT'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+  }
+  if url.get_backend_name() == 'postgresql' and config['DB_STATEMENT_TIMEOUT_MS']:
+    # set once per connection by libpq, no extra round trip per checkout
+    options['connect_args'] = {'options': f'-c statement_timeout={config["DB_STATEMENT_TIMEOUT_MS"]}'}
+  return options
+
+
+def sqlite_foreign_keys(engine):
+  # SQLite only enforces foreign keys, ON DELETE CASCADE included, on
+  # connections that ask for it
+  if engine.dialect.name != 'sqlite':
+    return
+
+  @event.listens_for(engine, 'connect')
+  def enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys = ON')
+    cursor.close()
+
+
+def pool_collectors(metrics, engine):
+  # gauges read from the pool at scrape time; `engine` is a callable since
+  # the engine only exists inside an app context
+  def gauge(name, help, read):
+    def collect():
+      pool = engine().pool
+      return read(pool) if isinstance(pool, TimedQueuePool) else 0
+    metrics.collect(name, help, 'gauge', collect)
+
+  gauge('fyyur_db_pool_size', 'Connections the pool keeps open.', lambda pool: pool.size())
+  gauge('fyyur_db_pool_checked_out', 'Connections currently in use.', lambda pool: pool.checkedout())
+  gauge('fyyur_db_pool_overflow', 'Connections open beyond the pool size.', lambda pool: max(pool.overflow(), 0))
+  metrics.collect('fyyur_db_pool_timeouts_total', 'Checkouts that gave up waiting for a connection.',
+    'counter', lambda: getattr(engine().pool, 'timeouts', 0))
+  metrics.register(lambda: getattr(engine().pool, 'waits', None))
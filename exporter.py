@@ -0,0 +1,118 @@
+#----------------------------------------------------------------------------#
+# Streaming export of shows, venues and artists as CSV or NDJSON.
+#
+# Rows are read through a server-side cursor (`yield_per`) and written out
+# one line at a time, so memory stays flat however large the tables get.
+# Venue and artist files use the column names `flask import` reads.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import select
+
+# rows fetched from the cursor per round trip
+YIELD_PER = 1000
+# bytes of output gathered before handing a chunk to the response
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = {
+  'csv': 'text/csv',
+  'ndjson': 'application/x-ndjson',
+}
+
+
+def shows_query(tables):
+  shows, venues, artists = tables['shows'], tables['venues'], tables['artists']
+  return select(
+    shows.c.venue_id, venues.c.name.label('venue_name'),
+    shows.c.artist_id, artists.c.name.label('artist_name'),
+    shows.c.start_time
+  ).select_from(
+    shows.join(venues, venues.c.id == shows.c.venue_id).join(artists, artists.c.id == shows.c.artist_id)
+  ).order_by(shows.c.start_time, shows.c.venue_id, shows.c.artist_id)
+
+
+def owners_query(tables, kind, link, key):
+  # one row per (owner, genre), ordered so an owner's rows are consecutive
+  owners, links = tables[kind], tables[link]
+  columns = [c for c in owners.c if c.key != 'updated_at']
+  return select(*columns, links.c.genre).select_from(
+    owners.outerjoin(links, links.c[key] == owners.c.id)
+  ).order_by(owners.c.id, links.c.genre)
+
+
+QUERIES = {
+  'shows': (shows_query, None),
+  'venues': (owners_query, ('venue_genres', 'venue_id')),
+  'artists': (owners_query, ('artist_genres', 'artist_id')),
+}
+
+
+def export_rows(engine, tables, kind):
+  # yields one dict per exported row from a streaming cursor
+  build, genres = QUERIES[kind]
+  query = build(tables) if genres is None else build(tables, kind, *genres)
+  with engine.connect() as connection:
+    result = connection.execution_options(yield_per=YIELD_PER).execute(query)
+    if genres is None:
+      for row in result:
+        yield dict(row._mapping)
+      return
+
+    # fold the genre rows of each owner into one record
+    current = None
+    for row in result:
+      row = dict(row._mapping)
+      genre = row.pop('genre')
+      if current is None or current['id'] != row['id']:
+        if current is not None:
+          yield current
+        current = row
+        current['genres'] = []
+      if genre is not None:
+        current['genres'].append(genre)
+    if current is not None:
+      yield current
+
+
+def json_value(value):
+  return value.isoformat() if isinstance(value, datetime) else value
+
+
+def as_ndjson(rows):
+  for row in rows:
+    yield json.dumps({key: json_value(value) for key, value in row.items()}) + '\n'
+
+
+def as_csv(rows):
+  buffer = io.StringIO()
+  writer = None
+  for row in rows:
+    if 'genres' in row:
+      row['genres'] = ', '.join(row['genres'])
+    if writer is None:
+      writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
+      writer.writeheader()
+    writer.writerow(row)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+
+def buffered(lines):
+  chunk, size = [], 0
+  for line in lines:
+    chunk.append(line)
+    size += len(line)
+    if size >= CHUNK_SIZE:
+      yield ''.join(chunk)
+      chunk, size = [], 0
+  if chunk:
+    yield ''.join(chunk)
+
+
+def export(engine, tables, kind, file_format):
+  rows = export_rows(engine, tables, kind)
+  return buffered(as_csv(rows) if file_format == 'csv' else as_ndjson(rows))
@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import FlaskForm as Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, DateField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError, Optional, NumberRange
 from enum import Enum
 
 class Genre(Enum):
@@ -95,17 +95,39 @@ class State(Enum):
         return [ (choice.value, choice.value) for choice in cls ] 
 
 class ShowForm(Form):
-    artist_id = StringField(
-        'artist_id'
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired()]
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = IntegerField(
+        'venue_id', validators=[DataRequired()]
     )
+    # seconds are optional, the form's placeholder leaves them out
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
+        format=['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'],
         default= datetime.today()
     )
+    # a series: the show repeated weekly or monthly, `occurrences` times
+    # in all or up to and including the day `until` (bookings.occurrences)
+    repeat = SelectField(
+        'repeat', choices=[('', 'Does not repeat'), ('weekly', 'Weekly'), ('monthly', 'Monthly')],
+        default=''
+    )
+    occurrences = IntegerField(
+        'occurrences', validators=[Optional(), NumberRange(min=1)]
+    )
+    until = DateField(
+        'until', validators=[Optional()]
+    )
+
+    def validate_repeat(self, field):
+        if field.data and not (self.occurrences.data or self.until.data):
+            raise ValidationError('A repeating show needs a number of occurrences or an end date')
+
+    def validate_until(self, field):
+        if field.data and self.start_time.data and field.data < self.start_time.data.date():
+            raise ValidationError('The end date is before the first show')
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,21 @@
+# gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported once in the master (preload_app) and forked into
+# the workers. A pooled connection must never be shared across processes,
+# so every worker throws away the engines' pools right after the fork and
+# opens its own connections on first use.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+raw_env = ['FYYUR_ENV=' + os.environ.get('FYYUR_ENV', 'production')]
+
+
+def post_fork(server, worker):
+  from app import app, db
+  with app.app_context():
+    # close=False leaves the parent's connections alone, just forgets them
+    for engine in db.engines.values():
+      engine.dispose(close=False)
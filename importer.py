@@ -0,0 +1,232 @@
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows from CSV or NDJSON files.
+#
+# Every row is validated with the same form the create pages use, valid
+# rows are written in chunks of `chunk_size`, one transaction per chunk:
+# COPY on PostgreSQL (psycopg2), executemany everywhere else. A chunk the
+# database refuses (e.g. one duplicate show) is rolled back and written
+# again row by row, so only the rows it refuses are reported as rejected.
+# Shows are not checked for booking conflicts (bookings.py), the file is
+# taken as the partner's schedule.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import os
+import re
+import time
+from sqlalchemy import func, select, text
+from werkzeug.datastructures import MultiDict
+from forms import ArtistForm, ShowForm, VenueForm
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'on'}
+
+# kind -> form, columns written to the table, genre link table and key
+SPECS = {
+  'venues': {
+    'form': VenueForm,
+    'columns': ['name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+      'website', 'seeking_talent', 'seeking_description'],
+    'booleans': ['seeking_talent'],
+    'genres': ('venue_genres', 'venue_id'),
+  },
+  'artists': {
+    'form': ArtistForm,
+    'columns': ['name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+      'website', 'seeking_venue', 'seeking_description'],
+    'booleans': ['seeking_venue'],
+    'genres': ('artist_genres', 'artist_id'),
+  },
+  'shows': {
+    'form': ShowForm,
+    'columns': ['venue_id', 'artist_id', 'start_time'],
+    'booleans': [],
+    'genres': None,
+  },
+}
+
+
+class ImportReport:
+  def __init__(self):
+    self.read = 0
+    self.inserted = 0
+    self.rejected = []  # (line number, errors)
+    self.started = time.perf_counter()
+    self.elapsed = 0.0
+
+  @property
+  def rows_per_second(self):
+    return self.inserted / self.elapsed if self.elapsed else 0.0
+
+
+def read_rows(path, file_format=None):
+  # yields (line number, dict) pairs; the format defaults to the extension
+  file_format = file_format or ('ndjson' if os.path.splitext(path)[1] in ('.ndjson', '.jsonl') else 'csv')
+  with open(path, newline='', encoding='utf-8') as f:
+    if file_format == 'csv':
+      reader = csv.DictReader(f)
+      for row in reader:
+        yield reader.line_num, row
+    else:
+      for line_number, line in enumerate(f, 1):
+        if line.strip():
+          try:
+            yield line_number, json.loads(line)
+          except ValueError as e:
+            yield line_number, e
+
+
+def form_data(row):
+  # MultiDict in the shape a posted form has; genres may be a list or text
+  data = MultiDict()
+  for key, value in row.items():
+    if key == 'genres':
+      if isinstance(value, str):
+        value = [g for g in re.split(r',\s*', value) if g]
+      for genre in value or []:
+        data.add('genres', genre)
+    elif value is not None:
+      data.add(key, str(value))
+  return data
+
+
+def validate(spec, row, known_ids):
+  # returns (values, genres) or raises ValueError with the form errors
+  if not isinstance(row, dict):
+    raise ValueError({'row': [str(row)]})
+  form = spec['form'](formdata=form_data(row), meta={'csrf': False})
+  if not form.validate():
+    raise ValueError(form.errors)
+
+  values = {}
+  for column in spec['columns']:
+    field = getattr(form, column, None)
+    value = field.data if field is not None else row.get(column)
+    if column in spec['booleans']:
+      value = str(value).strip().lower() in TRUE_VALUES if value not in (None, '') else False
+    values[column] = value if value != '' else None
+
+  if row.get('id') not in (None, ''):
+    try:
+      values['id'] = int(row['id'])
+    except ValueError:
+      raise ValueError({'id': ['Not a valid integer']})
+
+  if spec['genres'] is None:
+    # the form would fall back to its default start time
+    if not row.get('start_time'):
+      raise ValueError({'start_time': ['This field is required.']})
+    # the form only checks that the ids are integers
+    for column, table in (('venue_id', 'venues'), ('artist_id', 'artists')):
+      if values[column] not in known_ids[table]:
+        raise ValueError({column: [f'No such {table[:-1]}']})
+    return values, []
+  return values, list(form.genres.data)
+
+
+def allocate_ids(connection, table, count, taken=()):
+  # ids for rows that did not bring one, so genre links can refer to them;
+  # none of them one of `taken`, the explicit ids written alongside
+  taken = set(taken)
+  if connection.dialect.name == 'postgresql':
+    sequence = connection.execute(text("select pg_get_serial_sequence(:table, 'id')"),
+      {'table': table.name}).scalar()
+    ids = []
+    while len(ids) < count:
+      ids.extend(new_id for new_id in connection.execute(
+        text('select nextval(:sequence) from generate_series(1, :count)'),
+        {'sequence': sequence, 'count': count - len(ids)}).scalars() if new_id not in taken)
+    return ids
+  start = max(connection.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar(),
+    max(taken, default=0)) + 1
+  return list(range(start, start + count))
+
+
+def copy_rows(connection, table, rows):
+  columns = list(rows[0].keys())
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    writer.writerow(['' if row[c] is None else row[c] for c in columns])
+  buffer.seek(0)
+  cursor = connection.connection.cursor()
+  try:
+    cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+  finally:
+    cursor.close()
+
+
+def insert_rows(connection, table, rows):
+  if not rows:
+    return
+  if connection.dialect.driver == 'psycopg2':
+    copy_rows(connection, table, rows)
+  else:
+    connection.execute(table.insert(), rows)
+
+
+def write_chunk(engine, metadata, spec, table, chunk):
+  with engine.begin() as connection:
+    rows = [values for values, _ in chunk]
+    if spec['genres'] is not None:
+      # rows have to share one column set for COPY / executemany
+      missing = [values for values in rows if 'id' not in values]
+      taken = [values['id'] for values in rows if 'id' in values]
+      for values, new_id in zip(missing, allocate_ids(connection, table, len(missing), taken)):
+        values['id'] = new_id
+    insert_rows(connection, table, rows)
+    if spec['genres'] is not None:
+      link_table, key = spec['genres']
+      insert_rows(connection, metadata.tables[link_table],
+        [{key: values['id'], 'genre': genre} for values, genres in chunk for genre in genres])
+
+
+def reset_id_sequence(engine, table):
+  if engine.dialect.name == 'postgresql':
+    with engine.begin() as connection:
+      connection.execute(text("select setval(pg_get_serial_sequence(:table, 'id'), "
+        f'greatest((select max(id) from {table.name}), 1))'), {'table': table.name})
+
+
+def import_file(engine, metadata, kind, path, file_format=None, chunk_size=5000):
+  spec = SPECS[kind]
+  table = metadata.tables[kind]
+  report = ImportReport()
+
+  known_ids = {}
+  if kind == 'shows':
+    with engine.connect() as connection:
+      for name in ('venues', 'artists'):
+        known_ids[name] = set(connection.execute(select(metadata.tables[name].c.id)).scalars())
+
+  def flush(chunk, chunk_lines):
+    try:
+      write_chunk(engine, metadata, spec, table, chunk)
+      report.inserted += len(chunk)
+    except Exception as e:
+      if len(chunk) == 1:
+        report.rejected.append((chunk_lines[0], {'row': [str(getattr(e, 'orig', e)).strip()]}))
+        return
+      # the chunk was rolled back whole; ids allocated for it are still free
+      for item, line_number in zip(chunk, chunk_lines):
+        flush([item], [line_number])
+
+  chunk, chunk_lines = [], []
+  for line_number, row in read_rows(path, file_format):
+    report.read += 1
+    try:
+      chunk.append(validate(spec, row, known_ids))
+      chunk_lines.append(line_number)
+    except ValueError as e:
+      report.rejected.append((line_number, e.args[0]))
+    if len(chunk) >= chunk_size:
+      flush(chunk, chunk_lines)
+      chunk, chunk_lines = [], []
+  if chunk:
+    flush(chunk, chunk_lines)
+
+  if spec['genres'] is not None:
+    reset_id_sequence(engine, table)
+  report.elapsed = time.perf_counter() - report.started
+  return report
@@ -0,0 +1,255 @@
+#----------------------------------------------------------------------------#
+# Background jobs.
+#
+# Work a response does not have to wait for (warming the page cache after
+# a new show, reconciling the show counters, ...) is enqueued as a row of
+# the jobs table in the same transaction as the write that asks for it:
+# a rolled back request leaves no job behind and a committed one cannot
+# lose its job. Tasks are functions registered with @job_queue.task and
+# called with the job's JSON payload as keyword arguments, in an app
+# context of their own.
+#
+# Runners claim due jobs with an UPDATE ... RETURNING that only takes
+# queued rows (after FOR UPDATE SKIP LOCKED on PostgreSQL), so any number
+# of them can share the table. A failed job is retried after a delay
+# doubling from JOB_RETRY_SECONDS until it has run its max_attempts
+# times, then stays failed with its last error. A job still running after
+# JOB_TIMEOUT_SECONDS is taken to have lost its runner and runs again, so
+# tasks must be safe to repeat.
+#
+# With JOB_RUNNER = 'thread' every web process runs jobs on a bounded pool
+# of JOB_THREADS threads, started by its first request; jobs it was
+# running when it exits are retried after the timeout. With 'worker' only
+# `flask jobs work` processes run them. Every runner also enqueues the
+# periodic tasks of JOB_SCHEDULE: one job per task and slot of its
+# interval, kept unique by the (name, scheduled_for) index so that runners
+# racing for a slot enqueue it once.
+#----------------------------------------------------------------------------#
+
+import os
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (QUEUED, RUNNING, DONE, FAILED)
+
+# INSERT ... ON CONFLICT DO NOTHING of each dialect
+INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+class Task:
+  def __init__(self, name, function, max_attempts):
+    self.name = name
+    self.function = function
+    self.max_attempts = max_attempts
+
+
+class JobQueue:
+  def __init__(self, app=None, job=None, engine=None):
+    # `engine` is a callable, the engine only exists inside an app context
+    self.job_class = job
+    self.engine = engine
+    self.tasks = {}
+    self.app = None
+    # (task, outcome) -> jobs this process ran
+    self.runs = defaultdict(int)
+    self._wakeup = threading.Event()
+    self._runner = None
+    self._runner_pid = None
+    self._scheduled_at = 0.0
+    self._lock = threading.Lock()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    self.mode = app.config['JOB_RUNNER']
+    self.threads = app.config['JOB_THREADS']
+    self.poll_seconds = app.config['JOB_POLL_SECONDS']
+    self.retry_seconds = app.config['JOB_RETRY_SECONDS']
+    self.max_retry_seconds = app.config['JOB_MAX_RETRY_SECONDS']
+    self.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+    self.timeout = timedelta(seconds=app.config['JOB_TIMEOUT_SECONDS'])
+    self.schedule = app.config['JOB_SCHEDULE']
+    if self.mode == 'thread':
+      app.before_request(self.start)
+
+  def task(self, name=None, max_attempts=None):
+    # decorator registering a task under its function name
+    def decorator(function):
+      task_name = name or function.__name__
+      self.tasks[task_name] = Task(task_name, function, max_attempts or self.max_attempts)
+      return function
+    return decorator
+
+  def enqueue(self, db_session, name, delay=0, **payload):
+    # adds a job to db_session; it is due once the caller commits
+    if name not in self.tasks:
+      raise KeyError(f'no task named {name}')
+    job = self.job_class(name=name, payload=payload, state=QUEUED, attempts=0,
+      max_attempts=self.tasks[name].max_attempts, run_at=datetime.now() + timedelta(seconds=delay))
+    db_session.add(job)
+    db_session.info['jobs_enqueued'] = True
+    return job
+
+  def watch(self, session_class):
+    # wake this process's runner when a commit enqueued jobs
+    @event.listens_for(session_class, 'after_commit')
+    def wake_runner(db_session):
+      if db_session.info.pop('jobs_enqueued', False):
+        self.wake()
+
+    @event.listens_for(session_class, 'after_rollback')
+    def discard_wakeup(db_session):
+      db_session.info.pop('jobs_enqueued', None)
+
+  def wake(self):
+    # look for due jobs now rather than at the next poll
+    self._wakeup.set()
+
+  def start(self):
+    # this process's runner thread, started once, and again after a fork
+    if self._runner_pid == os.getpid():
+      return
+    with self._lock:
+      if self._runner_pid == os.getpid():
+        return
+      self._runner = threading.Thread(target=self.work, args=(self.threads, threading.Event()),
+        name='fyyur-jobs', daemon=True)
+      self._runner.start()
+      self._runner_pid = os.getpid()
+
+  def due(self, now):
+    jobs = self.job_class.__table__
+    return or_((jobs.c.state == QUEUED) & (jobs.c.run_at <= now),
+      (jobs.c.state == RUNNING) & (jobs.c.started_at < now - self.timeout))
+
+  def claim(self, connection, limit, now=None):
+    # marks up to `limit` due jobs running and returns them, oldest first
+    now = now or datetime.now()
+    jobs = self.job_class.__table__
+    ids = connection.execute(select(jobs.c.id).where(self.due(now)).order_by(jobs.c.run_at)
+      .limit(limit).with_for_update(skip_locked=True)).scalars().all()
+    if not ids:
+      return []
+    # due again: a runner without row locks (SQLite) may have taken some
+    claimed = connection.execute(update(jobs).where(jobs.c.id.in_(ids), self.due(now)).values(
+      state=RUNNING, started_at=now, attempts=jobs.c.attempts + 1
+    ).returning(jobs.c.id, jobs.c.name, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts)).all()
+    return sorted(claimed, key=lambda job: ids.index(job.id))
+
+  def backoff(self, attempts):
+    return timedelta(seconds=min(self.retry_seconds * 2 ** (attempts - 1), self.max_retry_seconds))
+
+  def run(self, job):
+    # runs a claimed job and records how it went
+    task = self.tasks.get(job.name)
+    error = None
+    try:
+      if task is None:
+        raise LookupError(f'no task named {job.name}')
+      with self.app.app_context():
+        task.function(**job.payload)
+    except Exception:
+      error = traceback.format_exc()
+      self.app.logger.warning('job %s (%s) failed, attempt %s of %s:\n%s',
+        job.id, job.name, job.attempts, job.max_attempts, error)
+
+    now = datetime.now()
+    if error is None:
+      outcome, values = DONE, {'state': DONE, 'finished_at': now, 'last_error': None}
+    elif job.attempts < job.max_attempts and task is not None:
+      outcome, values = 'retried', {'state': QUEUED, 'run_at': now + self.backoff(job.attempts), 'last_error': error}
+    else:
+      outcome, values = FAILED, {'state': FAILED, 'finished_at': now, 'last_error': error}
+    jobs = self.job_class.__table__
+    with self.app.app_context(), self.engine().begin() as connection:
+      # unless a runner took it over after the timeout
+      connection.execute(update(jobs).where(jobs.c.id == job.id, jobs.c.state == RUNNING,
+        jobs.c.attempts == job.attempts).values(**values))
+    with self._lock:
+      self.runs[(job.name, outcome)] += 1
+    # a thread is free
+    self.wake()
+
+  def enqueue_scheduled(self, connection, now=None):
+    # enqueues each task of the schedule for the slot of its interval `now`
+    # falls in, unless a runner already did; returns the names enqueued
+    now = now or datetime.now()
+    jobs = self.job_class.__table__
+    insert = INSERTS[connection.dialect.name]
+    enqueued = []
+    for name, seconds in self.schedule.items():
+      slot = datetime.fromtimestamp(now.timestamp() // seconds * seconds)
+      inserted = connection.execute(insert(jobs).values(name=name, payload={}, state=QUEUED,
+        attempts=0, max_attempts=self.tasks[name].max_attempts, run_at=now, scheduled_for=slot,
+        created_at=now).on_conflict_do_nothing(index_elements=['name', 'scheduled_for']))
+      if inserted.rowcount:
+        enqueued.append(name)
+    return enqueued
+
+  def work(self, threads, stop, once=False):
+    # claims due jobs for `threads` threads and runs them until stop is
+    # set; with once, returns when no job is due
+    with self.app.app_context(), ThreadPoolExecutor(threads, thread_name_prefix='fyyur-job') as pool:
+      running = set()
+      while not stop.is_set():
+        running = {future for future in running if not future.done()}
+        claimed = []
+        wait = self.poll_seconds
+        try:
+          with self.engine().begin() as connection:
+            if self.schedule and time.monotonic() - self._scheduled_at >= self.poll_seconds:
+              self._scheduled_at = time.monotonic()
+              self.enqueue_scheduled(connection)
+            if len(running) < threads:
+              claimed = self.claim(connection, threads - len(running))
+              if not claimed:
+                # sleep until the next retry, if it comes before the next poll
+                wait = min(wait, self.seconds_to_next(connection))
+        except Exception:
+          self.app.logger.exception('claiming jobs failed')
+        running.update(pool.submit(self.run, job) for job in claimed)
+        if once and not claimed and not running:
+          return
+        if not claimed:
+          self._wakeup.wait(wait)
+          self._wakeup.clear()
+
+  def seconds_to_next(self, connection):
+    # until the next queued job is due, infinity with none
+    jobs = self.job_class.__table__
+    next_run_at = connection.execute(select(func.min(jobs.c.run_at)).where(jobs.c.state == QUEUED)).scalar()
+    if next_run_at is None:
+      return float('inf')
+    return max((next_run_at - datetime.now()).total_seconds(), 0)
+
+  def depth(self):
+    # {(state,): jobs} of the whole table, for the metrics
+    jobs = self.job_class.__table__
+    with self.engine().connect() as connection:
+      counts = dict(connection.execute(select(jobs.c.state, func.count()).group_by(jobs.c.state)).all())
+    return {(state,): counts.get(state, 0) for state in STATES}
+
+  def oldest_due_seconds(self):
+    # how long the oldest due job has been waiting, 0 with none
+    jobs = self.job_class.__table__
+    now = datetime.now()
+    with self.engine().connect() as connection:
+      oldest = connection.execute(select(func.min(jobs.c.run_at))
+        .where(jobs.c.state == QUEUED, jobs.c.run_at <= now)).scalar()
+    return (now - oldest).total_seconds() if oldest else 0
+
+  def purge(self, connection, before):
+    # deletes the done jobs finished before `before`; returns how many
+    jobs = self.job_class.__table__
+    return connection.execute(jobs.delete().where(jobs.c.state == DONE, jobs.c.finished_at < before)).rowcount
@@ -0,0 +1,214 @@
+#----------------------------------------------------------------------------#
+# Per-request instrumentation and Prometheus metrics.
+#
+# Engine events count the SQL statements a request sends and the time they
+# take; template signals time rendering (lazy loads fired from a template
+# count towards both). Every response carries a Server-Timing header,
+# requests over the latency threshold or statement budget are logged, and
+# per-endpoint histograms are served in the Prometheus text format.
+# Metrics live in the worker process, scrape each worker on its own.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from collections import defaultdict
+from flask import g, has_app_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def format_labels(labels, extra=()):
+  pairs = list(labels) + list(extra)
+  if not pairs:
+    return ''
+  escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+  return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+  def __init__(self, name, help, buckets, label_names):
+    self.name = name
+    self.help = help
+    self.buckets = buckets
+    self.label_names = label_names
+    # label values -> [bucket counts, sum, count]
+    self._series = defaultdict(lambda: [[0] * len(buckets), 0.0, 0])
+    self._lock = threading.Lock()
+
+  def observe(self, value, *label_values):
+    with self._lock:
+      series = self._series[label_values]
+      for i, bound in enumerate(self.buckets):
+        if value <= bound:
+          series[0][i] += 1
+      series[1] += value
+      series[2] += 1
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+    with self._lock:
+      series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+    for label_values, (counts, total, count) in series:
+      labels = list(zip(self.label_names, label_values))
+      for bound, bucket_count in zip(self.buckets, counts):
+        lines.append(f'{self.name}_bucket{format_labels(labels, [("le", format_value(bound))])} {bucket_count}')
+      lines.append(f'{self.name}_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+      lines.append(f'{self.name}_sum{format_labels(labels)} {format_value(total)}')
+      lines.append(f'{self.name}_count{format_labels(labels)} {count}')
+    return lines
+
+
+class Collector:
+  # a value read at scrape time; `collect` returns a number or a
+  # {label values tuple: number} dict
+  def __init__(self, name, help, kind, collect, label_names=()):
+    self.name = name
+    self.help = help
+    self.kind = kind
+    self.collect = collect
+    self.label_names = label_names
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+    values = self.collect()
+    if not isinstance(values, dict):
+      values = {(): values}
+    for label_values, value in sorted(values.items()):
+      lines.append(f'{self.name}{format_labels(zip(self.label_names, label_values))} {format_value(value)}')
+    return lines
+
+
+class Deferred:
+  # a metric looked up at scrape time, e.g. one owned by a pool that is
+  # replaced after fork
+  def __init__(self, get_metric):
+    self.get_metric = get_metric
+
+  def render(self):
+    metric = self.get_metric()
+    return [] if metric is None else metric.render()
+
+
+class RequestTimer:
+  __slots__ = ('started', 'statements', 'sql_seconds', 'render_seconds', 'render_started')
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.statements = 0
+    self.sql_seconds = 0.0
+    self.render_seconds = 0.0
+    self.render_started = None
+
+
+def current_timer():
+  return g.get('request_timer') if has_app_context() else None
+
+
+class RequestMetrics:
+  def __init__(self, app=None):
+    self.slow_request_ms = 500
+    self.statement_budget = 20
+    self.logger = None
+    labels = ('method', 'endpoint')
+    self.duration = Histogram('fyyur_request_duration_seconds',
+      'Time from request start to response, streamed bodies excluded.', DURATION_BUCKETS, labels)
+    self.sql_duration = Histogram('fyyur_request_sql_duration_seconds',
+      'Time spent executing SQL statements per request.', DURATION_BUCKETS, labels)
+    self.render_duration = Histogram('fyyur_request_render_duration_seconds',
+      'Time spent rendering templates per request.', DURATION_BUCKETS, labels)
+    self.statements = Histogram('fyyur_request_sql_statements',
+      'SQL statements sent per request.', STATEMENT_BUCKETS, labels)
+    self.collectors = []
+    self._responses = defaultdict(int)
+    self._lock = threading.Lock()
+    self.collect('fyyur_responses_total', 'Responses sent, by endpoint and status.', 'counter',
+      self._response_counts, ('method', 'endpoint', 'status'))
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.slow_request_ms = app.config['METRICS_SLOW_REQUEST_MS']
+    self.statement_budget = app.config['METRICS_STATEMENT_BUDGET']
+    self.logger = app.logger
+    app.before_request(self.start_request)
+    app.after_request(self.finish_request)
+    before_render_template.connect(self.start_render, app)
+    template_rendered.connect(self.finish_render, app)
+    # on the Engine class, so every engine the app creates is covered
+    event.listen(Engine, 'before_cursor_execute', self.start_statement)
+    event.listen(Engine, 'after_cursor_execute', self.finish_statement)
+
+  def collect(self, name, help, kind, collect, label_names=()):
+    # register a gauge or counter read at scrape time
+    self.collectors.append(Collector(name, help, kind, collect, label_names))
+
+  def register(self, get_metric):
+    # register a callable returning a Histogram (or None) at scrape time
+    self.collectors.append(Deferred(get_metric))
+
+  def start_request(self):
+    g.request_timer = RequestTimer()
+
+  def finish_request(self, response):
+    timer = current_timer()
+    if timer is None:
+      return response
+    total = time.perf_counter() - timer.started
+    labels = (request.method, request.endpoint or 'unmatched')
+    self.duration.observe(total, *labels)
+    self.sql_duration.observe(timer.sql_seconds, *labels)
+    self.render_duration.observe(timer.render_seconds, *labels)
+    self.statements.observe(timer.statements, *labels)
+    with self._lock:
+      self._responses[labels + (str(response.status_code),)] += 1
+
+    response.headers.add('Server-Timing',
+      f'db;dur={timer.sql_seconds * 1000:.2f};desc="{timer.statements} statements", '
+      f'render;dur={timer.render_seconds * 1000:.2f}, total;dur={total * 1000:.2f}')
+
+    if total * 1000 > self.slow_request_ms or timer.statements > self.statement_budget:
+      self.logger.warning('slow request %s %s (%s): %.1fms total, %d statements in %.1fms, '
+        'render %.1fms', request.method, request.full_path.rstrip('?'), request.endpoint,
+        total * 1000, timer.statements, timer.sql_seconds * 1000, timer.render_seconds * 1000)
+    return response
+
+  def start_render(self, sender, template, context, **extra):
+    timer = current_timer()
+    if timer is not None:
+      timer.render_started = time.perf_counter()
+
+  def finish_render(self, sender, template, context, **extra):
+    timer = current_timer()
+    if timer is not None and timer.render_started is not None:
+      timer.render_seconds += time.perf_counter() - timer.render_started
+      timer.render_started = None
+
+  def start_statement(self, conn, cursor, statement, parameters, context, executemany):
+    if current_timer() is not None:
+      conn.info['statement_started'] = time.perf_counter()
+
+  def finish_statement(self, conn, cursor, statement, parameters, context, executemany):
+    timer = current_timer()
+    started = conn.info.pop('statement_started', None)
+    if timer is not None and started is not None:
+      timer.statements += 1
+      timer.sql_seconds += time.perf_counter() - started
+
+  def _response_counts(self):
+    with self._lock:
+      return dict(self._responses)
+
+  def render(self):
+    lines = []
+    for metric in (self.duration, self.sql_duration, self.render_duration, self.statements):
+      lines.extend(metric.render())
+    for collector in self.collectors:
+      lines.extend(collector.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,39 @@
+"""cascade deletes of venues and artists to their shows
+
+Revision ID: 3b9f6d2e8c15
+Revises: e41b7c9a2f58
+Create Date: 2026-10-18 19:48:06.215390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9f6d2e8c15'
+down_revision = 'e41b7c9a2f58'
+branch_labels = None
+depends_on = None
+
+
+def replace_foreign_keys(ondelete):
+    # the constraints were created unnamed, and rebuilding shows as a
+    # partitioned table (a7d3c91e4b20) may have suffixed their names
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys('shows'):
+        op.drop_constraint(foreign_key['name'], 'shows', type_='foreignkey')
+    for column, table in (('venue_id', 'venues'), ('artist_id', 'artists')):
+        op.create_foreign_key(f'shows_{column}_fkey', 'shows', table, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    # PostgreSQL only: SQLite cannot alter constraints in place, databases
+    # built there by db.create_all() already have the cascades
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    replace_foreign_keys(None)
@@ -0,0 +1,157 @@
+"""normalize genres into genre link tables
+
+Revision ID: 69e3f8230b99
+Revises: dca9171335dc
+Create Date: 2026-10-18 11:40:07.215634
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '69e3f8230b99'
+down_revision = 'dca9171335dc'
+branch_labels = None
+depends_on = None
+
+# values of forms.Genre at the time of this migration
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+    'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul',
+    'Other',
+]
+
+# owner table -> (link table, owner key column)
+LINKS = {
+    'venues': ('venue_genres', 'venue_id'),
+    'artists': ('artist_genres', 'artist_id'),
+}
+
+# rows read and written per statement while copying genres over
+BATCH_SIZE = 1000
+
+
+def drop_search_indexes():
+    # the search indexes of dca9171335dc cover the genres column
+    if op.get_bind().dialect.name == 'sqlite':
+        for name in LINKS:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'drop trigger if exists {name}_fts_{suffix}')
+            op.execute(f'drop table if exists {name}_fts')
+    else:
+        for name in LINKS:
+            op.drop_index(f'ix_{name}_search_trgm', table_name=name)
+
+
+def create_search_indexes(columns):
+    if op.get_bind().dialect.name == 'sqlite':
+        for name in LINKS:
+            fts = f'{name}_fts'
+            fields = ', '.join(columns)
+            new_fields = ', '.join(f'new.{c}' for c in columns)
+            old_fields = ', '.join(f'old.{c}' for c in columns)
+            op.execute(f"create virtual table {fts} using fts5({fields}, content='{name}', "
+                       f"content_rowid='id', tokenize='trigram')")
+            op.execute(f"create trigger {fts}_ai after insert on {name} begin "
+                       f"insert into {fts}(rowid, {fields}) values (new.id, {new_fields}); end")
+            op.execute(f"create trigger {fts}_ad after delete on {name} begin "
+                       f"insert into {fts}({fts}, rowid, {fields}) values ('delete', old.id, {old_fields}); end")
+            op.execute(f"create trigger {fts}_au after update on {name} begin "
+                       f"insert into {fts}({fts}, rowid, {fields}) values ('delete', old.id, {old_fields}); "
+                       f"insert into {fts}(rowid, {fields}) values (new.id, {new_fields}); end")
+            op.execute(f"insert into {fts}({fts}) values ('rebuild')")
+    else:
+        document = " || ' ' || ".join(columns)
+        for name in LINKS:
+            op.execute(f'create index ix_{name}_search_trgm on {name} '
+                       f'using gin (({document}) gin_trgm_ops)')
+
+
+def copy_genres_to_links(owner, link, key):
+    # walk the owner table in primary key order, one batch at a time
+    conn = op.get_bind()
+    known = {name for (name,) in conn.execute(sa.text('select name from genres'))}
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.text(f'select id, genres from {owner} where id > :last_id order by id limit :limit'),
+            {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        links = []
+        for owner_id, genres in rows:
+            # the old column held ', '.join(...) text, keep the first occurrence
+            names = dict.fromkeys(g.strip() for g in re.split(r',\s*', genres or '') if g.strip())
+            for name in names:
+                if name not in known:
+                    # legacy values outside forms.Genre (e.g. 'Swing') are kept
+                    conn.execute(sa.text('insert into genres (name) values (:name)'), {'name': name})
+                    known.add(name)
+                links.append({'owner_id': owner_id, 'genre': name})
+        if links:
+            conn.execute(
+                sa.text(f'insert into {link} ({key}, genre) values (:owner_id, :genre)'), links)
+        last_id = rows[-1][0]
+
+
+def copy_links_to_genres(owner, link, key):
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        ids = [owner_id for (owner_id,) in conn.execute(
+            sa.text(f'select id from {owner} where id > :last_id order by id limit :limit'),
+            {'last_id': last_id, 'limit': BATCH_SIZE})]
+        if not ids:
+            break
+        genres = {owner_id: [] for owner_id in ids}
+        for owner_id, genre in conn.execute(
+                sa.text(f'select {key}, genre from {link} where {key} between :first and :last'),
+                {'first': ids[0], 'last': ids[-1]}):
+            genres[owner_id].append(genre)
+        conn.execute(
+            sa.text(f'update {owner} set genres = :genres where id = :owner_id'),
+            [{'owner_id': owner_id, 'genres': ', '.join(names)} for owner_id, names in genres.items()])
+        last_id = ids[-1]
+
+
+def upgrade():
+    genres = op.create_table('genres',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(genres, [{'name': name} for name in GENRES])
+
+    for owner, (link, key) in LINKS.items():
+        op.create_table(link,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre', sa.String(length=50), nullable=False),
+        sa.ForeignKeyConstraint([key], [f'{owner}.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre'], ['genres.name'], ),
+        sa.PrimaryKeyConstraint(key, 'genre')
+        )
+        # "all <genre> venues" lookups lead with the genre
+        op.create_index(f'ix_{link}_genre_{key}', link, ['genre', key], unique=False)
+        copy_genres_to_links(owner, link, key)
+
+    drop_search_indexes()
+    for owner in LINKS:
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.drop_column('genres')
+    create_search_indexes(['name', 'city', 'state'])
+
+
+def downgrade():
+    drop_search_indexes()
+    for owner, (link, key) in LINKS.items():
+        op.add_column(owner, sa.Column('genres', sa.String(length=120), nullable=True))
+        copy_links_to_genres(owner, link, key)
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.alter_column('genres', existing_type=sa.String(length=120), nullable=False)
+        op.drop_index(f'ix_{link}_genre_{key}', table_name=link)
+        op.drop_table(link)
+    op.drop_table('genres')
+    create_search_indexes(['name', 'city', 'state', 'genres'])
@@ -0,0 +1,90 @@
+"""partition shows by month of start_time
+
+Revision ID: a7d3c91e4b20
+Revises: 5c2e8f0a7d41
+Create Date: 2026-10-18 18:05:47.902116
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3c91e4b20'
+down_revision = '5c2e8f0a7d41'
+branch_labels = None
+depends_on = None
+
+# months created ahead of the current one, as partitions.AHEAD
+AHEAD = 12
+INDEXES = {
+    'ix_shows_venue_id_start_time': ['venue_id', 'start_time'],
+    'ix_shows_artist_id_start_time': ['artist_id', 'start_time'],
+    'ix_shows_start_time': ['start_time', 'venue_id', 'artist_id'],
+}
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def create_shows(**kw):
+    op.create_table('shows',
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        # as created by be6c67d6c3ed; month bounds are in the session's time zone
+        sa.Column('start_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.current_timestamp()),
+        sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ),
+        sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ),
+        sa.PrimaryKeyConstraint('venue_id', 'artist_id', 'start_time', name='pk_venueid_artistid_starttime'),
+        **kw
+    )
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'shows', columns, unique=False)
+
+
+def rename_old_shows():
+    # free the names of the table, its primary key and its indexes
+    op.rename_table('shows', 'shows_old')
+    for name in ['pk_venueid_artistid_starttime', *INDEXES]:
+        op.execute(f'alter index {name} rename to {name}_old')
+
+
+def upgrade():
+    # PostgreSQL only, see partitions.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    rename_old_shows()
+    create_shows(postgresql_partition_by='RANGE (start_time)')
+    op.execute('create table shows_default partition of shows default')
+
+    # a partition for every month with shows, up to AHEAD months from now
+    first = op.get_bind().execute(sa.text('select min(start_time) from shows_old')).scalar()
+    now = datetime.now()
+    month = datetime((first or now).year, (first or now).month, 1)
+    last = datetime(now.year, now.month, 1)
+    for _ in range(AHEAD):
+        last = next_month(last)
+    latest = op.get_bind().execute(sa.text('select max(start_time) from shows_old')).scalar()
+    while month <= max(last, latest or last):
+        op.execute(f"create table shows_p{month.year:04d}_{month.month:02d} partition of shows "
+                   f"for values from ('{month:%Y-%m-%d}') to ('{next_month(month):%Y-%m-%d}')")
+        month = next_month(month)
+
+    op.execute('insert into shows (venue_id, artist_id, start_time, updated_at) '
+               'select venue_id, artist_id, start_time, updated_at from shows_old')
+    op.drop_table('shows_old')
+    op.execute('analyze shows')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    rename_old_shows()
+    create_shows()
+    op.execute('insert into shows (venue_id, artist_id, start_time, updated_at) '
+               'select venue_id, artist_id, start_time, updated_at from shows_old')
+    # drops the partitions with it; archived ones stay in the archive schema
+    op.drop_table('shows_old')
@@ -0,0 +1,62 @@
+"""search indexes for venues and artists
+
+Revision ID: dca9171335dc
+Revises: 441daa3be6bf
+Create Date: 2026-10-18 09:12:41.508113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dca9171335dc'
+down_revision = '441daa3be6bf'
+branch_labels = None
+depends_on = None
+
+# searchable columns per table, name first; the postgres index expression
+# must stay identical to search.search_document()
+SEARCH_COLUMNS = {
+    'venues': ['name', 'city', 'state', 'genres'],
+    'artists': ['name', 'city', 'state', 'genres'],
+}
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for name, columns in SEARCH_COLUMNS.items():
+            fts = f'{name}_fts'
+            fields = ', '.join(columns)
+            new_fields = ', '.join(f'new.{c}' for c in columns)
+            old_fields = ', '.join(f'old.{c}' for c in columns)
+            op.execute(f"create virtual table {fts} using fts5({fields}, content='{name}', "
+                       f"content_rowid='id', tokenize='trigram')")
+            op.execute(f"create trigger {fts}_ai after insert on {name} begin "
+                       f"insert into {fts}(rowid, {fields}) values (new.id, {new_fields}); end")
+            op.execute(f"create trigger {fts}_ad after delete on {name} begin "
+                       f"insert into {fts}({fts}, rowid, {fields}) values ('delete', old.id, {old_fields}); end")
+            op.execute(f"create trigger {fts}_au after update on {name} begin "
+                       f"insert into {fts}({fts}, rowid, {fields}) values ('delete', old.id, {old_fields}); "
+                       f"insert into {fts}(rowid, {fields}) values (new.id, {new_fields}); end")
+            # index the rows that already exist
+            op.execute(f"insert into {fts}({fts}) values ('rebuild')")
+        return
+
+    op.execute('create extension if not exists pg_trgm')
+    for name, columns in SEARCH_COLUMNS.items():
+        document = " || ' ' || ".join(columns)
+        op.execute(f'create index ix_{name}_search_trgm on {name} '
+                   f'using gin (({document}) gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for name in SEARCH_COLUMNS:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'drop trigger if exists {name}_fts_{suffix}')
+            op.execute(f'drop table if exists {name}_fts')
+        return
+
+    for name in SEARCH_COLUMNS:
+        op.drop_index(f'ix_{name}_search_trgm', table_name=name)
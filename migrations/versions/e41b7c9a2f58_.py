@@ -0,0 +1,31 @@
+"""name prefix indexes for the typeahead pickers
+
+Revision ID: e41b7c9a2f58
+Revises: a7d3c91e4b20
+Create Date: 2026-10-18 19:12:31.604178
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41b7c9a2f58'
+down_revision = 'a7d3c91e4b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # text_pattern_ops lets PostgreSQL serve lower(name) LIKE 'prefix%'
+    # from the index under any collation (see typeahead.py)
+    expression = 'lower(name)'
+    if op.get_bind().dialect.name == 'postgresql':
+        expression += ' text_pattern_ops'
+    for name in ('venues', 'artists'):
+        op.create_index(f'ix_{name}_name_prefix', name, [sa.text(expression)], unique=False)
+
+
+def downgrade():
+    for name in ('artists', 'venues'):
+        op.drop_index(f'ix_{name}_name_prefix', table_name=name)
@@ -0,0 +1,32 @@
+"""unique slot of scheduled jobs
+
+Revision ID: f2b8c47d1e06
+Revises: c6a1e5f04d93
+Create Date: 2026-10-18 23:05:12.318094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8c47d1e06'
+down_revision = 'c6a1e5f04d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # runners enqueue a periodic task with INSERT ... ON CONFLICT DO
+    # NOTHING on (name, scheduled_for); jobs from before have no slot and
+    # NULLs never conflict
+    op.add_column('jobs', sa.Column('scheduled_for', sa.DateTime(), nullable=True))
+    op.drop_index('ix_jobs_name_created_at', table_name='jobs')
+    op.create_index('uq_jobs_name_scheduled_for', 'jobs', ['name', 'scheduled_for'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_jobs_name_scheduled_for', table_name='jobs')
+    op.create_index('ix_jobs_name_created_at', 'jobs', ['name', 'created_at'], unique=False)
+    with op.batch_alter_table('jobs') as batch_op:
+        batch_op.drop_column('scheduled_for')
@@ -0,0 +1,122 @@
+#----------------------------------------------------------------------------#
+# Keyset (cursor based) pagination.
+#----------------------------------------------------------------------------#
+
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+class Page:
+  def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=None):
+    self.items = items
+    self.next_cursor = next_cursor
+    self.prev_cursor = prev_cursor
+    self.per_page = per_page
+
+  def __iter__(self):
+    return iter(self.items)
+
+  def __len__(self):
+    return len(self.items)
+
+
+def encode_cursor(values):
+  # datetimes are the only non json values used in our sort keys
+  values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+  raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+  return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+  # raises ValueError on anything that is not a cursor we handed out
+  try:
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    values = json.loads(raw.decode('utf-8'))
+  except (TypeError, UnicodeDecodeError, json.JSONDecodeError, base64.binascii.Error):
+    raise ValueError(f'invalid cursor {cursor!r}')
+  if not isinstance(values, list) or len(values) != len(columns):
+    raise ValueError(f'invalid cursor {cursor!r}')
+  decoded = []
+  for column, value in zip(columns, values):
+    expected = key_type(column)
+    if value is None:
+      if not nullable(column):
+        raise ValueError(f'invalid cursor {cursor!r}')
+    elif expected is datetime:
+      if not isinstance(value, str):
+        raise ValueError(f'invalid cursor {cursor!r}')
+      value = datetime.fromisoformat(value)
+    elif expected is float and isinstance(value, int) and not isinstance(value, bool):
+      value = float(value)
+    if value is not None and (isinstance(value, (list, dict))
+        or isinstance(value, bool) and expected is not bool
+        or expected is not None and not isinstance(value, expected)):
+      raise ValueError(f'invalid cursor {cursor!r}')
+    decoded.append(value)
+  return decoded
+
+
+def key_type(column):
+  # the python type of a sort key column, None for expressions without one
+  # (func.lower() and the like)
+  try:
+    return column.type.python_type
+  except NotImplementedError:
+    return None
+
+
+def nullable(column):
+  # mapped attributes and table columns know; other expressions might be
+  return getattr(getattr(column, 'expression', column), 'nullable', True)
+
+
+def row_key(item, columns):
+  return [getattr(item, column.key) for column in columns]
+
+
+def keyset_query(query, columns, after=None, before=None, per_page=20):
+  # `columns` is the sort key; it has to be unique (end with the primary key)
+  # so that every row has exactly one position between two cursors.
+  # Both directions seek with a row comparison on the same key, so the
+  # database can walk an index from the cursor instead of skipping rows.
+  # The redundant bound on the leading column is one a planner can prune
+  # partitions with, which it cannot do from the row comparison.
+  # Works on ORM queries and select() statements alike.
+  key = tuple_(*columns)
+  if before:
+    values = decode_cursor(before, columns)
+    query = query.filter(key < tuple_(*values), columns[0] <= values[0])
+    query = query.order_by(*[column.desc() for column in columns])
+  else:
+    if after:
+      values = decode_cursor(after, columns)
+      query = query.filter(key > tuple_(*values), columns[0] >= values[0])
+    query = query.order_by(*columns)
+  return query.limit(per_page + 1)
+
+
+def keyset_page(items, columns, after=None, before=None, per_page=20):
+  # the Page for the rows a keyset_query() returned
+  items = list(items)
+  has_more = len(items) > per_page
+  items = items[:per_page]
+
+  if before:
+    items.reverse()
+    has_next, has_prev = True, has_more
+  else:
+    has_next, has_prev = has_more, bool(after)
+
+  next_cursor = prev_cursor = None
+  if items and has_next:
+    next_cursor = encode_cursor(row_key(items[-1], columns))
+  if items and has_prev:
+    prev_cursor = encode_cursor(row_key(items[0], columns))
+  return Page(items, next_cursor, prev_cursor, per_page)
+
+
+def keyset_paginate(query, columns, after=None, before=None, per_page=20):
+  items = keyset_query(query, columns, after, before, per_page).all()
+  return keyset_page(items, columns, after, before, per_page)
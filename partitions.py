@@ -0,0 +1,122 @@
+#----------------------------------------------------------------------------#
+# Monthly range partitions of shows (PostgreSQL).
+#
+# shows is partitioned by start_time into one table per calendar month,
+# shows_p2026_10 for October 2026, plus shows_default for rows outside
+# every month. Queries bounded on start_time (upcoming shows, a keyset
+# page of /shows) only read the months they can match.
+#
+# `flask partitions create` keeps the months up to --ahead months from now
+# in place, moving any of their rows out of the default partition first;
+# run it from cron well before the last month fills. `flask partitions
+# archive --before 2024-01` detaches the months before January 2024 and
+# moves them to the archive schema, or drops them with --drop. Archived
+# shows are gone from every page and from the show counters.
+#----------------------------------------------------------------------------#
+
+import re
+from datetime import datetime
+
+TABLE = 'shows'
+DEFAULT = 'shows_default'
+ARCHIVE_SCHEMA = 'archive'
+# months created ahead of the current one
+AHEAD = 12
+NAME = re.compile(r'^shows_p(\d{4})_(\d{2})$')
+
+
+class Partition:
+  def __init__(self, name, start, end, rows):
+    self.name = name
+    self.start = start
+    self.end = end
+    self.rows = rows
+
+
+def require_postgresql(connection):
+  if connection.dialect.name != 'postgresql':
+    raise RuntimeError('shows is only partitioned on PostgreSQL')
+
+
+def month_start(value):
+  return datetime(value.year, value.month, 1)
+
+
+def next_month(month):
+  return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months(first, last):
+  # the first day of every month from first's to last's, inclusive
+  month = month_start(first)
+  while month <= last:
+    yield month
+    month = next_month(month)
+
+
+def partition_name(month):
+  return f'shows_p{month.year:04d}_{month.month:02d}'
+
+
+def partitions(connection):
+  # the monthly partitions of shows, oldest first; rows are the planner's
+  # estimate (-1 before the first ANALYZE)
+  require_postgresql(connection)
+  result = connection.exec_driver_sql(
+    "SELECT c.relname, c.reltuples::bigint FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+    "WHERE i.inhparent = 'shows'::regclass")
+  found = []
+  for name, rows in result:
+    match = NAME.match(name)
+    if match:
+      start = datetime(int(match.group(1)), int(match.group(2)), 1)
+      found.append(Partition(name, start, next_month(start), rows))
+  return sorted(found, key=lambda partition: partition.start)
+
+
+def create_default(connection):
+  require_postgresql(connection)
+  connection.exec_driver_sql(f'CREATE TABLE IF NOT EXISTS {DEFAULT} PARTITION OF {TABLE} DEFAULT')
+
+
+def create_partition(connection, month):
+  # the month's rows may already sit in the default partition; move them
+  # into the new table before attaching it, attaching checks for them
+  name = partition_name(month)
+  start, end = f"'{month:%Y-%m-%d}'", f"'{next_month(month):%Y-%m-%d}'"
+  connection.exec_driver_sql(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+  connection.exec_driver_sql(
+    f'WITH moved AS (DELETE FROM {DEFAULT} WHERE start_time >= {start} AND start_time < {end} RETURNING *) '
+    f'INSERT INTO {name} SELECT * FROM moved')
+  connection.exec_driver_sql(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})')
+  return name
+
+
+def ensure_partitions(connection, since=None, ahead=AHEAD, now=None):
+  # creates the missing months from `since` (default: this month) up to
+  # `ahead` months from now; returns the names of the new partitions
+  require_postgresql(connection)
+  now = now or datetime.now()
+  last = month_start(now)
+  for _ in range(ahead):
+    last = next_month(last)
+  existing = {partition.start for partition in partitions(connection)}
+  if since is None:
+    # start after the newest month, never fill gaps left by archiving
+    since = next_month(max(existing)) if existing else now
+  return [create_partition(connection, month) for month in months(since, last) if month not in existing]
+
+
+def archive_partitions(connection, before, drop=False):
+  # detaches every month that ends on or before `before` and moves it to
+  # the archive schema, or drops it; returns the affected partitions
+  old = [partition for partition in partitions(connection) if partition.end <= before]
+  if old and not drop:
+    connection.exec_driver_sql(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}')
+  for partition in old:
+    connection.exec_driver_sql(f'ALTER TABLE {TABLE} DETACH PARTITION {partition.name}')
+    if drop:
+      connection.exec_driver_sql(f'DROP TABLE {partition.name}')
+    else:
+      connection.exec_driver_sql(f'ALTER TABLE {partition.name} SET SCHEMA {ARCHIVE_SCHEMA}')
+  return old
@@ -0,0 +1,131 @@
+#----------------------------------------------------------------------------#
+# On-demand request profiler.
+#
+# With PROFILER_ENABLED set, a request carrying an `X-Profile` header or a
+# `profile` query parameter is traced with sys.setprofile and its call
+# stacks are written to PROFILER_DIR in the collapsed-stack format
+# ("outer;inner;leaf <microseconds>"), which flamegraph.pl and speedscope
+# both read. Weights are self time, so a flame graph shows wall time spent
+# in each Python function and builtin, SQL and I/O included. Tracing slows
+# the request down several times; compare profiles with each other, not
+# with the Server-Timing numbers of untraced requests.
+#----------------------------------------------------------------------------#
+
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from flask import g, request
+
+EXTENSION = '.collapsed'
+# <timestamp>_<endpoint>_<milliseconds>ms.collapsed
+FILENAME = re.compile(r'^(\d{8}T\d{6}\.\d{6})_([\w.]+)_(\d+)ms\.collapsed$')
+
+
+def frame_label(code):
+  return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackTracer:
+  # self time per call stack of the thread that starts it; frames that were
+  # already running at start() are left out, so stacks root at the first
+  # call made after it
+  def __init__(self):
+    self.stacks = defaultdict(float)
+    self._stack = []
+    self._last = None
+
+  def start(self):
+    self._last = time.perf_counter()
+    sys.setprofile(self._trace)
+
+  def stop(self):
+    sys.setprofile(None)
+
+  def _trace(self, frame, event, arg):
+    now = time.perf_counter()
+    if self._stack:
+      self.stacks[tuple(self._stack)] += now - self._last
+    if event == 'call':
+      self._stack.append(frame_label(frame.f_code))
+    elif event == 'c_call':
+      self._stack.append(f'{getattr(arg, "__qualname__", arg)} (builtin)')
+    elif self._stack:
+      # return, c_return, c_exception
+      self._stack.pop()
+    self._last = now
+
+  def collapsed(self):
+    lines = []
+    for stack, seconds in sorted(self.stacks.items()):
+      microseconds = int(seconds * 1e6)
+      if microseconds:
+        lines.append(f'{";".join(stack)} {microseconds}')
+    return '\n'.join(lines) + '\n'
+
+
+class Profile:
+  def __init__(self, name, endpoint, created, milliseconds):
+    self.name = name
+    self.endpoint = endpoint
+    self.created = created
+    self.milliseconds = milliseconds
+
+
+class RequestProfiler:
+  def __init__(self, app=None):
+    self.enabled = False
+    self.directory = None
+    self.keep = 100
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.enabled = app.config['PROFILER_ENABLED']
+    self.directory = app.config['PROFILER_DIR']
+    self.keep = app.config['PROFILER_KEEP']
+    if self.enabled:
+      app.before_request(self.start_request)
+      app.after_request(self.finish_request)
+
+  def requested(self):
+    return 'X-Profile' in request.headers or 'profile' in request.args
+
+  def start_request(self):
+    if self.requested():
+      g.profiler = StackTracer()
+      g.profiler_started = time.perf_counter()
+      g.profiler.start()
+
+  def finish_request(self, response):
+    tracer = g.pop('profiler', None)
+    if tracer is None:
+      return response
+    tracer.stop()
+    milliseconds = int((time.perf_counter() - g.pop('profiler_started')) * 1000)
+    name = self.save(tracer, request.endpoint or 'unmatched', milliseconds)
+    response.headers['X-Profile'] = name
+    return response
+
+  def save(self, tracer, endpoint, milliseconds):
+    os.makedirs(self.directory, exist_ok=True)
+    name = f'{datetime.now():%Y%m%dT%H%M%S.%f}_{endpoint}_{milliseconds}ms{EXTENSION}'
+    with open(os.path.join(self.directory, name), 'w') as f:
+      f.write(tracer.collapsed())
+    for old in self.profiles()[self.keep:]:
+      os.remove(os.path.join(self.directory, old.name))
+    return name
+
+  def profiles(self):
+    # newest first
+    if not self.directory or not os.path.isdir(self.directory):
+      return []
+    profiles = []
+    for name in os.listdir(self.directory):
+      match = FILENAME.match(name)
+      if match:
+        created = datetime.strptime(match.group(1), '%Y%m%dT%H%M%S.%f')
+        profiles.append(Profile(name, match.group(2), created, int(match.group(3))))
+    return sorted(profiles, key=lambda profile: profile.created, reverse=True)
@@ -0,0 +1,76 @@
+#----------------------------------------------------------------------------#
+# Query plan regression check.
+#
+# Drives the read routes through the Flask test client, records every
+# statement they send, runs EXPLAIN on the ones that read the shows table
+# and reports the ones whose plan falls back to a full scan of shows.
+# Run it against a seeded database with `flask check-query-plans`; the
+# test suite runs it too (tests/test_query_plans.py).
+#----------------------------------------------------------------------------#
+
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# plan lines that mean "read the whole table". On SQLite that is any SCAN
+# of shows, walks of an index or a covering index included: an aggregate
+# or an unbounded listing reads every entry of it. Only SEARCH passes.
+FULL_SCAN = {
+  # partitions of shows included
+  'postgresql': re.compile(r'Seq Scan on shows(_p\d{4}_\d{2}|_default)?\b'),
+  'sqlite': re.compile(r'\bSCAN shows\b'),
+}
+EXPLAIN = {
+  'postgresql': 'EXPLAIN ',
+  'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+READS_SHOWS = re.compile(r'\bshows\b')
+
+
+@contextmanager
+def recorded_statements(engine):
+  statements = []
+  def record(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith('SELECT'):
+      statements.append((statement, parameters))
+  event.listen(engine, 'before_cursor_execute', record)
+  try:
+    yield statements
+  finally:
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def explain(connection, statement, parameters):
+  dialect = connection.dialect.name
+  result = connection.exec_driver_sql(EXPLAIN[dialect] + statement, parameters)
+  # postgres returns one text column, sqlite (id, parent, notused, detail)
+  return [str(row[-1]) for row in result]
+
+
+def check_query_plans(app, db, urls):
+  # returns a list of (url, statement, plan) for every full scan of shows
+  dialect = db.engine.dialect.name
+  if dialect not in FULL_SCAN:
+    raise RuntimeError(f'no query plan check for {dialect}')
+
+  client = app.test_client()
+  failures = []
+  for url in urls:
+    with recorded_statements(db.engine) as statements:
+      response = client.get(url)
+    if response.status_code != 200:
+      failures.append((url, None, [f'HTTP {response.status_code}']))
+      continue
+
+    with db.engine.connect() as connection:
+      if dialect == 'postgresql':
+        # seeded databases are small enough that a seq scan is simply
+        # cheaper; disable it so only a missing index shows up as one
+        connection.exec_driver_sql('SET enable_seqscan = off')
+      for statement, parameters in statements:
+        if not READS_SHOWS.search(statement):
+          continue
+        plan = explain(connection, statement, parameters)
+        if any(FULL_SCAN[dialect].search(line) for line in plan):
+          failures.append((url, statement, plan))
+  return failures
@@ -0,0 +1,164 @@
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#
+# Replicas are listed in DATABASE_REPLICA_URLS and created as the binds
+# replica_0, replica_1, ... next to the primary. The session of a GET or
+# HEAD request reads from the next replica in turn, one replica for the
+# whole request; flushes, other methods and the CLI stay on the primary.
+# After a request commits a write the client's Flask session is pinned to
+# the primary for REPLICA_READ_AFTER_WRITE seconds, so the redirect after
+# an edit shows the edit even while the replicas are behind. The page
+# cache keeps the pages of each database apart and is bypassed while a
+# client is pinned (see cache_variant in app.py).
+#
+# A replica is skipped once a connection to it fails, or when it lags more
+# than REPLICA_MAX_LAG seconds. It is checked again every
+# REPLICA_CHECK_INTERVAL seconds. With no healthy replica everything goes
+# to the primary.
+#----------------------------------------------------------------------------#
+
+import itertools
+import threading
+import time
+from flask import has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+READ_METHODS = ('GET', 'HEAD')
+PRIMARY_UNTIL = '_read_primary_until'
+
+# seconds the replica is behind the primary; NULL when it is no standby.
+# The last replayed commit gets older while the primary is idle: a standby
+# that replayed all the WAL it received is not behind
+LAG_QUERY = {
+  'postgresql': 'select case when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0 '
+    'else extract(epoch from now() - pg_last_xact_replay_timestamp()) end',
+}
+PING_QUERY = 'select null'
+
+
+class Replica:
+  def __init__(self, key):
+    self.key = key
+    self.healthy = True
+    self.checked_at = 0.0
+    self.sessions = 0
+
+
+class ReplicaRouter:
+  def __init__(self, app=None, db=None):
+    self.replicas = []
+    self.read_after_write = 5
+    self.check_interval = 10
+    self.max_lag = 30
+    self._db = None
+    self._cycle = None
+    self._lock = threading.Lock()
+    if app is not None:
+      self.init_app(app, db)
+
+  def init_app(self, app, db):
+    self._db = db
+    self.read_after_write = app.config['REPLICA_READ_AFTER_WRITE']
+    self.check_interval = app.config['REPLICA_CHECK_INTERVAL']
+    self.max_lag = app.config['REPLICA_MAX_LAG']
+    self.replicas = [Replica(key) for key in sorted(app.config.get('SQLALCHEMY_BINDS') or {})
+      if key.startswith('replica_')]
+    self._cycle = itertools.cycle(self.replicas)
+    if not self.replicas:
+      return
+
+    with app.app_context():
+      for replica in self.replicas:
+        event.listen(db.engines[replica.key], 'handle_error', self._failed(replica))
+
+    @event.listens_for(db.session, 'after_flush')
+    def remember_write(db_session, flush_context):
+      db_session.info['wrote'] = True
+
+    @event.listens_for(db.session, 'after_commit')
+    def pin_to_primary(db_session):
+      if db_session.info.pop('wrote', False) and has_request_context():
+        session[PRIMARY_UNTIL] = time.time() + self.read_after_write
+
+    @event.listens_for(db.session, 'after_rollback')
+    def forget_write(db_session):
+      db_session.info.pop('wrote', None)
+
+  def _failed(self, replica):
+    def handle_error(context):
+      if context.is_disconnect or context.connection is None:
+        replica.healthy = False
+        replica.checked_at = time.monotonic()
+    return handle_error
+
+  def reading(self):
+    # whether the current request may read from a replica
+    if not self.replicas or not has_request_context() or request.method not in READ_METHODS:
+      return False
+    return not self.pinned()
+
+  def pinned(self):
+    # whether the current client wrote recently and reads from the primary
+    return has_request_context() and session.get(PRIMARY_UNTIL, 0) >= time.time()
+
+  def engine(self):
+    # the next healthy replica's engine, or None for the primary. A replica
+    # due a check is probed outside the lock, a probe can wait out a
+    # connect timeout; the thread taking the check sets checked_at first,
+    # so the others keep using the last result meanwhile
+    for _ in range(len(self.replicas)):
+      with self._lock:
+        replica = next(self._cycle)
+        due = time.monotonic() - replica.checked_at > self.check_interval
+        if due:
+          replica.checked_at = time.monotonic()
+        elif replica.healthy:
+          replica.sessions += 1
+          return self._db.engines[replica.key]
+      if not due:
+        continue
+      healthy = self.probe(replica)
+      with self._lock:
+        replica.healthy = healthy
+        if healthy:
+          replica.sessions += 1
+          return self._db.engines[replica.key]
+    return None
+
+  def probe(self, replica):
+    # whether the replica answers and is at most max_lag seconds behind
+    engine = self._db.engines[replica.key]
+    try:
+      with engine.connect() as connection:
+        lag = connection.execute(text(LAG_QUERY.get(engine.dialect.name, PING_QUERY))).scalar()
+    except Exception:
+      return False
+    return lag is None or lag <= self.max_lag
+
+  def healthy(self):
+    return {(replica.key,): int(replica.healthy) for replica in self.replicas}
+
+  def sessions(self):
+    return {(replica.key,): replica.sessions for replica in self.replicas}
+
+
+class RoutingSession(Session):
+  # set on the session factory by app.py
+  router = None
+
+  def read_replica(self):
+    # the replica engine this session reads from, None for the primary;
+    # one replica for the session, a request reads a single snapshot
+    if self.router is None or not self.router.reading():
+      return None
+    if 'replica' not in self.info:
+      self.info['replica'] = self.router.engine()
+    return self.info['replica']
+
+  def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+    if bind is None and not self._flushing:
+      replica = self.read_replica()
+      if replica is not None:
+        return replica
+    return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,122 @@
+#----------------------------------------------------------------------------#
+# Ranked search over venues and artists.
+#
+# On PostgreSQL the searchable columns are concatenated into one document
+# that has a pg_trgm GIN expression index (see the migration adding
+# ix_venues_search_trgm / ix_artists_search_trgm), so every word of the
+# search term is an indexed ILIKE and results are ranked by trigram
+# similarity. On SQLite the same columns are mirrored into an FTS5 table
+# using the trigram tokenizer and ranked with bm25(). Genres live in their
+# own link tables and are matched through those.
+#----------------------------------------------------------------------------#
+
+import re
+from sqlalchemy import DDL, Float, column, event, func, literal, literal_column, or_, select, table
+
+# FTS5 trigram queries need at least three characters per word
+MIN_FTS_WORD = 3
+
+
+def search_words(search_term):
+  return [w for w in re.split(r'[\s,]+', search_term or '') if w]
+
+
+def search_document(columns):
+  # the exact expression the trigram index was built on, so the planner
+  # matches it: name || ' ' || city || ' ' || ...
+  document = columns[0]
+  for c in columns[1:]:
+    document = document.op('||')(literal_column("' '")).op('||')(c)
+  return document
+
+
+def fts_table(model):
+  return table(f'{model.__tablename__}_fts', column('rowid'))
+
+
+def fts_ddl(model, columns):
+  name = model.__tablename__
+  fts = f'{name}_fts'
+  fields = ', '.join(c.key for c in columns)
+  new_fields = ', '.join(f'new.{c.key}' for c in columns)
+  old_fields = ', '.join(f'old.{c.key}' for c in columns)
+  return [
+    f"CREATE VIRTUAL TABLE {fts} USING fts5({fields}, content='{name}', "
+    f"content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {name} BEGIN "
+    f"INSERT INTO {fts}(rowid, {fields}) VALUES (new.id, {new_fields}); END",
+    f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {name} BEGIN "
+    f"INSERT INTO {fts}({fts}, rowid, {fields}) VALUES ('delete', old.id, {old_fields}); END",
+    f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {name} BEGIN "
+    f"INSERT INTO {fts}({fts}, rowid, {fields}) VALUES ('delete', old.id, {old_fields}); "
+    f"INSERT INTO {fts}(rowid, {fields}) VALUES (new.id, {new_fields}); END",
+  ]
+
+
+def fts_drop_ddl(model):
+  fts = f'{model.__tablename__}_fts'
+  return [f'DROP TRIGGER IF EXISTS {fts}_{suffix}' for suffix in ('ai', 'ad', 'au')] + [
+    f'DROP TABLE IF EXISTS {fts}']
+
+
+def register_fts(model, columns):
+  # mirror the migration for databases built with db.create_all() on
+  # SQLite, and drop the mirror with db.drop_all()
+  for statement in fts_ddl(model, columns):
+    event.listen(model.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+  for statement in fts_drop_ddl(model):
+    event.listen(model.__table__, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def fts_phrase(word):
+  return '"{}"'.format(word.replace('"', '""'))
+
+
+def search(session, model, columns, search_term, genres=None):
+  # returns a query of (id, name, rank) rows and its keyset sort key, best
+  # match first; `columns` lists the searchable columns, the name first.
+  # `genres` is (owner id, genre) of the model's genre link table plus the
+  # genre name column of the genres table: a word naming a genre also
+  # matches through the (genre, owner id) index of the link table.
+  words = search_words(search_term)
+  document = search_document(columns)
+  sqlite = session.get_bind().dialect.name == 'sqlite'
+  fts = fts_table(model)
+  query = session.query(model.id, columns[0])
+
+  genre_names = []
+  if genres and words:
+    owner_id, genre, genre_name = genres
+    genre_names = [name for (name,) in session.query(genre_name)]
+
+  for w in words:
+    if sqlite and len(w) >= MIN_FTS_WORD:
+      condition = model.id.in_(select(fts.c.rowid).where(
+        literal_column(fts.name).op('MATCH')(fts_phrase(w))))
+    else:
+      condition = document.ilike('%{}%'.format(w))
+    matched = [name for name in genre_names if w.lower() in name.lower()]
+    if matched:
+      condition = or_(condition, model.id.in_(select(owner_id).where(genre.in_(matched))))
+    query = query.filter(condition)
+
+  if sqlite:
+    long_words = [w for w in words if len(w) >= MIN_FTS_WORD]
+    if long_words:
+      # bm25 is lower for better matches, weighted towards the name column
+      weights = [10.0] + [1.0] * (len(columns) - 1)
+      scores = select(fts.c.rowid,
+        func.bm25(literal_column(fts.name), *weights, type_=Float).label('score')
+      ).where(literal_column(fts.name).op('MATCH')(' OR '.join(map(fts_phrase, long_words)))
+      ).subquery()
+      query = query.outerjoin(scores, scores.c.rowid == model.id)
+      rank = func.coalesce(scores.c.score, 0.0, type_=Float)
+    else:
+      rank = literal(0.0, Float)
+  else:
+    # negated so that an ascending sort puts the best match first
+    rank = -(func.word_similarity(search_term, document, type_=Float) +
+      func.similarity(columns[0], search_term, type_=Float))
+
+  rank = rank.label('rank')
+  return query.add_columns(rank), [rank, columns[0], model.id]
@@ -2,3 +2,36 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// name pickers: suggest names from a typeahead endpoint and copy the id of
+// the chosen one into the target field
+document.querySelectorAll('[data-typeahead]').forEach(function (input) {
+  var list = document.getElementById(input.getAttribute('list'));
+  var target = document.getElementById(input.dataset.typeaheadTarget);
+  var ids = {};
+  var pending = null;
+
+  input.addEventListener('input', function () {
+    if (ids.hasOwnProperty(input.value)) {
+      target.value = ids[input.value];
+      return;
+    }
+    clearTimeout(pending);
+    pending = setTimeout(function () {
+      if (!input.value.trim()) return;
+      fetch(input.dataset.typeahead + '?q=' + encodeURIComponent(input.value))
+        .then(function (response) { return response.json(); })
+        .then(function (result) {
+          ids = {};
+          list.innerHTML = '';
+          result.data.forEach(function (match) {
+            var option = document.createElement('option');
+            // names are not unique
+            option.value = match.name + ' #' + match.id;
+            list.appendChild(option);
+            ids[option.value] = match.id;
+          });
+        });
+    }, 100);
+  });
+});
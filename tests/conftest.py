@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+# app.py reads its configuration when it is first imported, and logs to
+# error.log in the working directory
+WORKDIR = tempfile.mkdtemp(prefix='fyyur-tests-')
+os.chdir(WORKDIR)
+os.environ['FYYUR_ENV'] = 'test'
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'fyyur.db')
+os.environ['JOB_RUNNER'] = 'worker'
+
+
+@pytest.fixture(scope='session')
+def app():
+  # the whole session shares one generated catalog
+  import catalog
+  catalog.generate(os.environ['DATABASE_URL'], venues=200, artists=200, shows=4000, echo=lambda line: None)
+  from app import app
+  return app
+
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+
+@pytest.fixture
+def page_cache(app):
+  # TestConfig turns the page cache off; a fresh memory backend for one test
+  from app import page_cache
+  from cache import MemoryCache
+  page_cache.backend = MemoryCache()
+  yield page_cache
+  page_cache.backend = None
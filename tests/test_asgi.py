@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip('starlette')
+pytest.importorskip('aiosqlite')
+pytest.importorskip('httpx')
+
+
+@pytest.fixture
+def async_client(app):
+  from starlette.testclient import TestClient
+  import asgi
+  with TestClient(asgi.app) as client:
+    yield client
+
+
+def test_flash_round_trips_through_async_page(async_client):
+  # a failed edit (Flask) flashes and redirects to the venue page (async)
+  response = async_client.post('/venues/1/edit', data={'name': ''}, follow_redirects=False)
+  assert response.status_code == 302
+  page = async_client.get(response.headers['location'])
+  assert 'This field is required.' in page.text
+  # consumed there, not shown again on the next Flask page
+  assert 'This field is required.' not in async_client.get('/venues/create').text
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+
+import bookings
+
+
+def test_series_conflicts_are_the_overlapping_occurrences(app):
+  from app import db, Show
+  length = timedelta(hours=3)
+  with app.app_context():
+    booked = db.session.query(Show).order_by(Show.start_time.desc()).first()
+    # weekly from four weeks earlier, the fifth one an hour before the show
+    start_times = bookings.occurrences(booked.start_time - timedelta(weeks=4, hours=1), 'weekly', 8)
+    found = bookings.conflicts(db.session, Show, booked.venue_id, -1, start_times, length)
+    assert list(found) == [start_times[4]]
+    assert [tuple(row) for row in found[start_times[4]]] == [
+      (booked.venue_id, booked.artist_id, booked.start_time)]
+    # only the venue's schedule is taken
+    assert bookings.conflicts(db.session, Show, -1, -1, start_times, length) == {}
+    db.session.rollback()
+
+
+def test_calendar_window_with_utc_offset(client):
+  # converted to the naive server-local times shows are stored in
+  end = datetime(2030, 1, 1, tzinfo=timezone.utc)
+  response = client.get('/venues/2/calendar', query_string={
+    'start': '2029-12-20T00:00:00+00:00', 'end': end.isoformat()})
+  assert response.status_code == 200
+  assert response.get_json()['end'] == end.astimezone().replace(tzinfo=None).isoformat()
+  # a naive start with an aware end compares too
+  assert client.get('/venues/2/calendar?start=2029-12-20&end=2030-01-01T00:00:00%2B00:00').status_code == 200
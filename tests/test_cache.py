@@ -0,0 +1,33 @@
+import time
+
+
+def test_cached_calendar_stays_json(client, page_cache):
+  first = client.get('/venues/1/calendar')
+  hits = page_cache.hits
+  second = client.get('/venues/1/calendar')
+  assert page_cache.hits == hits + 1
+  assert second.mimetype == first.mimetype == 'application/json'
+  assert second.get_json() == first.get_json()
+
+
+def test_cached_page_stays_html(client, page_cache):
+  client.get('/venues/1')
+  second = client.get('/venues/1')
+  assert second.mimetype == 'text/html'
+
+
+def test_pinned_client_bypasses_the_cache(app, client, page_cache):
+  # a client that just wrote reads the primary, never a cached page that
+  # may have come from a lagging replica
+  from replicas import PRIMARY_UNTIL
+  client.get('/venues/2')
+  with client.session_transaction() as client_session:
+    client_session[PRIMARY_UNTIL] = time.time() + 60
+  hits, misses = page_cache.hits, page_cache.misses
+  client.get('/venues/2')
+  assert (page_cache.hits, page_cache.misses) == (hits, misses)
+
+
+def test_pages_are_cached_per_database(app, client, page_cache):
+  client.get('/venues/3')
+  assert [key for key in page_cache.backend._entries if key.endswith('/venues/3?')] == ['primary:/venues/3?']
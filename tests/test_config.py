@@ -0,0 +1,11 @@
+from config import database_url
+
+
+def test_postgres_urls_use_psycopg2():
+  assert database_url('postgres://u:p@db:5432/fyyur') == 'postgresql+psycopg2://u:p@db:5432/fyyur'
+  assert database_url('postgresql://u:p@db/fyyur') == 'postgresql+psycopg2://u:p@db/fyyur'
+
+
+def test_other_urls_are_kept():
+  for url in ('postgresql+psycopg2://u@db/fyyur', 'postgresql+asyncpg://u@db/fyyur', 'sqlite:////tmp/fyyur.db'):
+    assert database_url(url) == url
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+
+def counts(db, model):
+  return {row_id: (upcoming, past) for row_id, upcoming, past in db.session.query(
+    model.id, model.upcoming_shows_count, model.past_shows_count)}
+
+
+def test_show_creation_and_venue_deletion(app, client):
+  from app import db, show_counters, Artist, Show, Venue
+  with app.app_context():
+    artist = db.session.get(Artist, 150)
+    before = (artist.upcoming_shows_count, artist.past_shows_count)
+    venue = Venue(name='Counted Hall', city='Boston', state='MA', address='1 Main St')
+    db.session.add(venue)
+    db.session.flush()
+    watermark = show_counters.watermark(db.session.connection())
+    db.session.add_all([
+      Show(venue_id=venue.id, artist_id=artist.id, start_time=watermark + timedelta(days=3)),
+      Show(venue_id=venue.id, artist_id=artist.id, start_time=watermark + timedelta(days=4)),
+      Show(venue_id=venue.id, artist_id=artist.id, start_time=watermark - timedelta(days=3)),
+    ])
+    db.session.commit()
+    venue_id = venue.id
+    assert counts(db, Venue)[venue_id] == (2, 1)
+    assert counts(db, Artist)[artist.id] == (before[0] + 2, before[1] + 1)
+
+  # the venue's shows leave the artist's counts with it
+  assert client.delete(f'/venues/{venue_id}').get_json()['state'] == 'success'
+  with app.app_context():
+    assert counts(db, Artist)[150] == before
+
+
+def test_recount_keeps_the_maintained_counts(app):
+  # rebuilding at the current watermark changes nothing, however often
+  from app import db, show_counters, Artist, Venue
+  with app.app_context():
+    maintained = counts(db, Venue), counts(db, Artist)
+    watermark = show_counters.watermark(db.session.connection())
+    for _ in range(2):
+      show_counters.recount(db.session, now=watermark)
+      db.session.commit()
+      assert (counts(db, Venue), counts(db, Artist)) == maintained
+
+
+def test_reconcile_moves_started_shows(app):
+  from app import db, show_counters, Artist, Show, Venue
+  with app.app_context():
+    watermark = show_counters.watermark(db.session.connection())
+    later = watermark + timedelta(days=30)
+    moved = show_counters.reconcile(db.session, now=later)
+    db.session.commit()
+    reconciled = counts(db, Venue), counts(db, Artist)
+    assert moved == db.session.query(Show).filter(Show.start_time > watermark, Show.start_time <= later).count()
+    assert show_counters.reconcile(db.session, now=later) == 0
+    show_counters.recount(db.session, now=later)
+    db.session.commit()
+    assert (counts(db, Venue), counts(db, Artist)) == reconciled
+    # back to where the other tests expect the watermark
+    show_counters.recount(db.session, now=watermark)
+    db.session.commit()
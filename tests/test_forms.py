@@ -0,0 +1,21 @@
+from datetime import datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+
+@pytest.mark.parametrize('start_time', ['2031-03-04 20:30', '2031-03-04 20:30:00'])
+def test_show_start_time_formats(app, start_time):
+  # the placeholder of the show form asks for YYYY-MM-DD HH:MM
+  from forms import ShowForm
+  with app.test_request_context():
+    form = ShowForm(formdata=MultiDict({'artist_id': '1', 'venue_id': '1', 'start_time': start_time}))
+    assert form.validate(), form.errors
+    assert form.start_time.data == datetime(2031, 3, 4, 20, 30)
+
+
+def test_create_show_with_placeholder_format(client):
+  response = client.post('/shows/create', data={'artist_id': 3, 'venue_id': 4,
+    'start_time': '2032-07-08 21:15'})
+  assert response.status_code == 200
+  assert 'Show was successfully listed!' in response.get_data(as_text=True)
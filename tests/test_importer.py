@@ -0,0 +1,50 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, select
+
+import db_pool
+import importer
+
+
+@pytest.fixture
+def engine(app, tmp_path):
+  # a database of its own: the shared catalog's venue ids are not ours
+  from app import db
+  engine = create_engine(f'sqlite:///{tmp_path}/import.db')
+  db_pool.sqlite_foreign_keys(engine)
+  # seeds the genres too
+  db.metadata.create_all(engine)
+  yield engine
+  engine.dispose()
+
+
+def venue(name, **row):
+  return dict(name=name, city='Boston', state='MA', address='1 Main St', genres=['Jazz'],
+    facebook_link='https://www.facebook.com/' + name.replace(' ', ''), **row)
+
+
+def test_bad_rows_do_not_reject_their_chunk(app, engine, tmp_path):
+  from app import db
+  rows = [
+    venue('First'),              # allocated an id, past the explicit 1 below
+    venue('Second', id=1),
+    venue('Third', id=1),        # refused by the database
+    {'name': 'No city'},         # refused by the form
+    venue('Fourth'),
+  ]
+  path = tmp_path / 'venues.ndjson'
+  path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+
+  with app.app_context():
+    report = importer.import_file(engine, db.metadata, 'venues', str(path), chunk_size=10)
+
+  assert (report.read, report.inserted) == (5, 3)
+  assert [line_number for line_number, _ in report.rejected] == [4, 3]
+  venues, links = db.metadata.tables['venues'], db.metadata.tables['venue_genres']
+  with engine.connect() as connection:
+    names = dict(connection.execute(select(venues.c.id, venues.c.name)).all())
+    linked = set(connection.execute(select(links.c.venue_id)).scalars())
+  assert names[1] == 'Second'
+  assert sorted(names.values()) == ['First', 'Fourth', 'Second']
+  assert linked == set(names)
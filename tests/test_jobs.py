@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import FAILED, QUEUED
+
+
+@pytest.fixture
+def job_queue(app):
+  # an empty jobs table and a task that always fails
+  from app import db, job_queue, Job
+  def clear():
+    with app.app_context(), db.engine.begin() as connection:
+      connection.execute(Job.__table__.delete())
+  clear()
+  job_queue.task(name='explode', max_attempts=3)(lambda **payload: 1 / 0)
+  yield job_queue
+  job_queue.tasks.pop('explode')
+  clear()
+
+
+def enqueue(app, queue, count):
+  from app import db
+  with app.app_context():
+    jobs = [queue.enqueue(db.session, 'explode') for _ in range(count)]
+    db.session.commit()
+    return [job.id for job in jobs]
+
+
+def claim(app, queue, limit, now):
+  with app.app_context(), queue.engine().begin() as connection:
+    return queue.claim(connection, limit, now=now)
+
+
+def test_claims_skip_claimed_jobs(app, job_queue):
+  ids = enqueue(app, job_queue, 3)
+  now = datetime.now() + timedelta(seconds=1)
+  first = claim(app, job_queue, 2, now)
+  second = claim(app, job_queue, 2, now)
+  assert [job.id for job in first] == ids[:2]
+  assert [job.id for job in second] == ids[2:]
+  assert claim(app, job_queue, 2, now) == []
+  # until a runner has held them past the timeout
+  late = now + job_queue.timeout + timedelta(seconds=1)
+  assert [(job.id, job.attempts) for job in claim(app, job_queue, 5, late)] == [(i, 2) for i in ids]
+
+
+def test_failures_back_off_then_fail(app, job_queue):
+  from app import db, Job
+  retry = job_queue.retry_seconds
+  assert [job_queue.backoff(n).total_seconds() for n in (1, 2, 3)] == [retry, 2 * retry, 4 * retry]
+  assert job_queue.backoff(20) == timedelta(seconds=job_queue.max_retry_seconds)
+
+  [job_id] = enqueue(app, job_queue, 1)
+  now = datetime.now() + timedelta(seconds=1)
+  for attempt in (1, 2):
+    [job] = claim(app, job_queue, 1, now)
+    ran_at = datetime.now()
+    job_queue.run(job)
+    with app.app_context():
+      row = db.session.get(Job, job_id)
+      assert (row.state, row.attempts) == (QUEUED, attempt)
+      assert 'ZeroDivisionError' in row.last_error
+      assert ran_at + job_queue.backoff(attempt) <= row.run_at <= datetime.now() + job_queue.backoff(attempt)
+      # not due before then
+      assert claim(app, job_queue, 1, row.run_at - timedelta(seconds=1)) == []
+      now = row.run_at
+
+  [job] = claim(app, job_queue, 1, now)
+  job_queue.run(job)
+  with app.app_context():
+    row = db.session.get(Job, job_id)
+    assert (row.state, row.attempts) == (FAILED, 3)
+  assert claim(app, job_queue, 1, now + timedelta(days=1)) == []
+
+
+def test_scheduled_slot_is_enqueued_once(app, job_queue):
+  from app import Job
+  now = datetime(2031, 5, 4, 12, 0, 30)
+  with app.app_context(), job_queue.engine().begin() as connection:
+    assert job_queue.enqueue_scheduled(connection, now) == list(job_queue.schedule)
+    # another runner, later in the same slots
+    assert job_queue.enqueue_scheduled(connection, now + timedelta(seconds=1)) == []
+    rows = connection.execute(Job.__table__.select()).all()
+  assert sorted(row.name for row in rows) == sorted(job_queue.schedule)
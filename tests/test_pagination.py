@@ -0,0 +1,77 @@
+import re
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, keyset_paginate
+
+
+def cursor(values):
+  return encode_cursor(values)
+
+
+@pytest.mark.parametrize('values', [
+  [123, 0, 0],
+  [None, 0, 0],
+  [{'a': 1}, 0, 0],
+  ['not a date', 0, 0],
+  ['2030-01-01T20:00:00', '1', 0],
+  ['2030-01-01T20:00:00', True, 0],
+  ['2030-01-01T20:00:00', 1],
+])
+def test_malformed_show_cursor_is_a_bad_request(client, values):
+  assert client.get('/shows', query_string={'after': cursor(values)}).status_code == 400
+  assert client.get('/shows', query_string={'before': cursor(values)}).status_code == 400
+
+
+@pytest.mark.parametrize('values', [
+  ['a', 'b', None, 1],
+  ['a', 'b', 'name', [1]],
+  ['a', 'b', 'name', 1.5],
+])
+def test_malformed_venue_cursor_is_a_bad_request(client, values):
+  assert client.get('/venues', query_string={'after': cursor(values)}).status_code == 400
+
+
+def test_cursor_round_trips(app):
+  import app as fyyur
+  with app.app_context():
+    _, columns = fyyur.shows_query()
+    row = fyyur.db.session.query(*columns).order_by(*columns).first()
+  assert decode_cursor(encode_cursor(list(row)), columns) == list(row)
+
+
+def test_walk_forward_and_back(app):
+  # every show exactly once, in order, and the same pages walking back
+  import app as fyyur
+  with app.app_context():
+    query, columns = fyyur.shows_query()
+    everything = [tuple(row) for row in fyyur.db.session.query(*columns).order_by(*columns)]
+
+    pages, after = [], None
+    while True:
+      page = keyset_paginate(query, columns, after=after, per_page=70)
+      pages.append([(show.start_time, show.venue_id, show.artist_id) for show in page])
+      if not page.next_cursor:
+        break
+      after = page.next_cursor
+    assert [key for keys in pages for key in keys] == everything
+
+    back, before = [pages[-1]], page.prev_cursor
+    while before:
+      page = keyset_paginate(query, columns, before=before, per_page=70)
+      back.append([(show.start_time, show.venue_id, show.artist_id) for show in page])
+      before = page.prev_cursor
+    assert back[::-1] == pages
+
+
+def test_pager_links_keep_the_page_size(client):
+  html = client.get('/artists?per_page=7').get_data(as_text=True)
+  after = re.search(r'\?after=([\w-]+)&amp;per_page=7"', html).group(1)
+  html = client.get(f'/artists?after={after}&per_page=7').get_data(as_text=True)
+  assert re.search(r'\?before=[\w-]+&amp;per_page=7"', html)
+  assert re.search(r'\?after=[\w-]+&amp;per_page=7"', html)
+
+
+def test_search_pager_keeps_the_page_size(client):
+  html = client.post('/artists/search', data={'search_term': 'a', 'per_page': '3'}).get_data(as_text=True)
+  assert '<input type="hidden" name="per_page" value="3">' in html
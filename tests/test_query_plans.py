@@ -0,0 +1,19 @@
+import query_plans
+
+
+def test_read_routes_search_shows(app):
+  import app as fyyur
+  with app.app_context():
+    urls = fyyur.query_plan_urls()
+    failures = query_plans.check_query_plans(app, fyyur.db, urls)
+  assert failures == []
+
+
+def test_unbounded_listing_is_a_full_scan(app):
+  # an ordered walk of a whole index is what the first /shows page used
+  # to be; it must not pass
+  import app as fyyur
+  with app.app_context(), fyyur.db.engine.connect() as connection:
+    plan = query_plans.explain(connection,
+      'SELECT start_time FROM shows ORDER BY start_time, venue_id, artist_id LIMIT 21', ())
+  assert any(query_plans.FULL_SCAN['sqlite'].search(line) for line in plan)
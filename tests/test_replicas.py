@@ -0,0 +1,74 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+import replicas
+from replicas import PRIMARY_UNTIL, Replica, ReplicaRouter
+
+
+class Binds:
+  # what the router reads of Flask-SQLAlchemy
+  def __init__(self, engines):
+    self.engines = engines
+
+
+@pytest.fixture
+def router(tmp_path):
+  # two replicas answering, one that cannot be connected to
+  engines = {
+    'replica_0': create_engine(f'sqlite:///{tmp_path}/replica_0.db'),
+    'replica_1': create_engine(f'sqlite:///{tmp_path}/replica_1.db'),
+    'replica_2': create_engine(f'sqlite:///{tmp_path}/missing/replica_2.db'),
+  }
+  router = ReplicaRouter()
+  router._db = Binds(engines)
+  router.replicas = [Replica(key) for key in sorted(engines)]
+  router._cycle = iter(router.replicas * 100)
+  yield router
+  for engine in engines.values():
+    engine.dispose()
+
+
+def used(router, times):
+  engines = {engine: key for key, engine in router._db.engines.items()}
+  return [engines.get(router.engine()) for _ in range(times)]
+
+
+def test_round_robin_skips_a_failed_replica(router):
+  assert used(router, 4) == ['replica_0', 'replica_1', 'replica_0', 'replica_1']
+  assert router.healthy() == {('replica_0',): 1, ('replica_1',): 1, ('replica_2',): 0}
+  assert router.sessions() == {('replica_0',): 2, ('replica_1',): 2, ('replica_2',): 0}
+
+
+def test_lagging_replicas_fall_back_to_the_primary(router, monkeypatch):
+  monkeypatch.setitem(replicas.LAG_QUERY, 'sqlite', 'select 31')
+  assert used(router, 2) == [None, None]
+  # rechecked once the interval passed
+  monkeypatch.setitem(replicas.LAG_QUERY, 'sqlite', 'select 0')
+  assert used(router, 1) == [None]
+  for replica in router.replicas:
+    replica.checked_at -= router.check_interval + 1
+  assert used(router, 1) == ['replica_0']
+
+
+def test_probes_run_outside_the_lock(router, monkeypatch):
+  locked = []
+  probe = router.probe
+  def recording_probe(replica):
+    locked.append(router._lock.locked())
+    return probe(replica)
+  monkeypatch.setattr(router, 'probe', recording_probe)
+  router.engine()
+  assert locked == [False]
+
+
+def test_reads_of_pinned_clients_and_writes_stay_on_the_primary(app, router):
+  with app.test_request_context('/venues', method='GET'):
+    assert router.reading()
+  with app.test_request_context('/venues/create', method='POST'):
+    assert not router.reading()
+  with app.test_request_context('/venues', method='GET'):
+    from flask import session
+    session[PRIMARY_UNTIL] = time.time() + 5
+    assert router.pinned() and not router.reading()
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+
+def test_renamed_and_deleted_venues_leave_the_index(app, client):
+  from app import db, venue_names, Venue
+  with app.app_context():
+    venue_names.load(db.session)
+    venue = Venue(name='Zyzzyva Lounge', city='Boston', state='MA', address='1 Main St')
+    db.session.add(venue)
+    db.session.commit()
+    venue_id = venue.id
+    assert venue_names.search('zyzz', 5) == [(venue_id, 'Zyzzyva Lounge')]
+
+    venue.name = 'Zyxt Room'
+    db.session.commit()
+    assert venue_names.search('zyzz', 5) == []
+    assert venue_names.search('ZYX', 5) == [(venue_id, 'Zyxt Room')]
+
+  # a set-based delete, no flush: staged and applied on commit
+  assert client.delete(f'/venues/{venue_id}').get_json()['state'] == 'success'
+  assert venue_names.search('zyx', 5) == []
+  with app.app_context():
+    assert len(venue_names) == db.session.query(Venue).count()
+
+
+def test_refresh_picks_up_other_writers(app):
+  # rows another worker wrote, no flush of this process saw them
+  from app import db, venue_names, Venue
+  with app.app_context():
+    venue_names.load(db.session)
+    with db.engine.begin() as connection:
+      venue_id = connection.execute(Venue.__table__.insert().values(name='Zebulon Stage', city='Boston',
+        state='MA', address='1 Main St', updated_at=datetime.now())).inserted_primary_key[0]
+    assert venue_names.search('zebulon', 5) == []
+    venue_names._checked_at -= venue_names.refresh_seconds + 1
+    venue_names.refresh(db.session)
+    assert venue_names.search('zebulon', 5) == [(venue_id, 'Zebulon Stage')]
@@ -0,0 +1,158 @@
+#----------------------------------------------------------------------------#
+# Name typeahead for the venue and artist pickers.
+#
+# PrefixIndex keeps (lowercased name, id, name) of a whole table as one
+# sorted list in process memory: a prefix query is a bisect to the first
+# name at or after the prefix and a walk while names still start with it.
+# Commits in this process apply the venues or artists they insert, edit
+# or delete to the index (watch, or stage for set-based deletes). Rows
+# written by other workers are picked up by a refresh at most every
+# TYPEAHEAD_REFRESH_SECONDS, which reads only the rows updated since the
+# last one, and reloads the table when its row count shows deletes.
+#
+# With TYPEAHEAD_INDEX_ENABLED off, prefix_query answers from the database
+# with a range scan of the lower(name) expression index (text_pattern_ops
+# on PostgreSQL, see the migration adding ix_venues_name_prefix).
+#----------------------------------------------------------------------------#
+
+import bisect
+import threading
+import time
+from datetime import timedelta
+from sqlalchemy import event, func, select
+
+# commits can land after rows updated later than them; a refresh re-reads
+# this much before the latest update it has seen
+LATE_COMMITS = timedelta(seconds=60)
+
+
+def prefix_key(value):
+  return value.strip().lower()
+
+
+def escape_like(value):
+  return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def prefix_query(session, model, prefix, limit):
+  # (id, name) of the first `limit` rows whose name starts with prefix,
+  # case-insensitively, from the lower(name) index
+  key = prefix_key(prefix)
+  lowered = func.lower(model.name)
+  if session.get_bind().dialect.name == 'postgresql':
+    # text_pattern_ops serves LIKE 'prefix%' whatever the collation
+    condition = lowered.like(escape_like(key) + '%', escape='\\')
+  else:
+    # SQLite only uses an index for LIKE on plain columns
+    condition = (lowered >= key) & (lowered < key[:-1] + chr(ord(key[-1]) + 1))
+  return session.query(model.id, model.name).filter(condition).order_by(lowered, model.id).limit(limit)
+
+
+class PrefixIndex:
+  def __init__(self, model, refresh_seconds=5):
+    self.model = model
+    self.refresh_seconds = refresh_seconds
+    self.loaded = False
+    # sorted (key, id, name), and the entry of every id
+    self._entries = []
+    self._by_id = {}
+    self._updated_at = None
+    self._checked_at = None
+    self._lock = threading.Lock()
+    self._info_key = f'typeahead_{model.__tablename__}'
+
+  def __len__(self):
+    return len(self._entries)
+
+  def search(self, prefix, limit):
+    # (id, name) of the first `limit` names starting with prefix
+    key = prefix_key(prefix)
+    with self._lock:
+      start = bisect.bisect_left(self._entries, (key,))
+      found = []
+      for entry_key, entry_id, name in self._entries[start:start + limit]:
+        if not entry_key.startswith(key):
+          break
+        found.append((entry_id, name))
+      return found
+
+  def load(self, session):
+    rows = session.execute(select(self.model.id, self.model.name, self.model.updated_at)).all()
+    entries = sorted((prefix_key(name), row_id, name) for row_id, name, _ in rows)
+    with self._lock:
+      self._entries = entries
+      self._by_id = {entry[1]: entry for entry in entries}
+      self._updated_at = max((updated_at for _, _, updated_at in rows), default=None)
+      self._checked_at = time.monotonic()
+      self.loaded = True
+
+  def refresh(self, session):
+    # loads the table the first time, then every refresh_seconds applies
+    # the rows other processes updated; cheap to call on every request
+    if not self.loaded:
+      self.load(session)
+      return
+    if time.monotonic() - self._checked_at < self.refresh_seconds:
+      return
+    self._checked_at = time.monotonic()
+    changed = select(self.model.id, self.model.name, self.model.updated_at)
+    if self._updated_at is not None:
+      changed = changed.where(self.model.updated_at >= self._updated_at - LATE_COMMITS)
+    rows = session.execute(changed).all()
+    count = session.execute(select(func.count()).select_from(self.model)).scalar()
+    with self._lock:
+      for row_id, name, updated_at in rows:
+        self._put(row_id, name)
+        self._updated_at = max(self._updated_at or updated_at, updated_at)
+      deleted = count != len(self._by_id)
+    if deleted:
+      self.load(session)
+
+  def apply(self, changes):
+    # [(id, name)] of inserted or edited rows, name None for deleted ones
+    with self._lock:
+      for row_id, name in changes:
+        if name is None:
+          self._remove(row_id)
+        else:
+          self._put(row_id, name)
+
+  def stage(self, db_session, changes):
+    # changes written without a flush (Core statements), applied when
+    # db_session commits
+    db_session.info.setdefault(self._info_key, []).extend(changes)
+
+  def watch(self, session_class):
+    # collect the rows a flush writes, apply them once committed
+    @event.listens_for(session_class, 'after_flush')
+    def collect_changes(db_session, flush_context):
+      changes = db_session.info.setdefault(self._info_key, [])
+      for instance in list(db_session.new) + list(db_session.dirty):
+        if isinstance(instance, self.model):
+          changes.append((instance.id, instance.name))
+      for instance in db_session.deleted:
+        if isinstance(instance, self.model):
+          changes.append((instance.id, None))
+
+    @event.listens_for(session_class, 'after_commit')
+    def apply_changes(db_session):
+      changes = db_session.info.pop(self._info_key, None)
+      if changes and self.loaded:
+        self.apply(changes)
+
+    @event.listens_for(session_class, 'after_rollback')
+    def discard_changes(db_session):
+      db_session.info.pop(self._info_key, None)
+
+  def _put(self, row_id, name):
+    entry = (prefix_key(name), row_id, name)
+    if self._by_id.get(row_id) == entry:
+      return
+    self._remove(row_id)
+    bisect.insort(self._entries, entry)
+    self._by_id[row_id] = entry
+
+  def _remove(self, row_id):
+    entry = self._by_id.pop(row_id, None)
+    if entry is not None:
+      del self._entries[bisect.bisect_left(self._entries, entry)]
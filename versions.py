@@ -0,0 +1,48 @@
+#----------------------------------------------------------------------------#
+# Listing versions.
+#
+# The /venues, /artists and /shows listings change with any write to the
+# rows they list, so their validators (see cache.conditional) read one
+# row per listing of listing_versions instead of max(updated_at) and
+# count(*) over whole tables: a primary key lookup whatever the catalog
+# size. Flushes bump the version of every listing the rows they write
+# appear in, in the same transaction; Core statements (set-based deletes,
+# imports, archived partitions) call bump() themselves.
+#
+# A bump is an UPDATE of the version row, which keeps it locked until the
+# transaction ends (PostgreSQL): writers to the same listing commit one
+# after the other.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+from sqlalchemy import event, update
+
+LISTINGS = ('venues', 'artists', 'shows')
+
+
+class ListingVersions:
+  def __init__(self, version, listings_for=None):
+    self.versions = version.__table__
+    # (instance, deleted) -> names of the listings writing it changes
+    self.listings_for = listings_for
+
+  def seed(self, connection):
+    connection.execute(self.versions.insert(),
+      [{'name': name, 'version': 0, 'changed_at': datetime.now()} for name in LISTINGS])
+
+  def bump(self, connection, names):
+    names = sorted(set(names))
+    if names:
+      connection.execute(update(self.versions).where(self.versions.c.name.in_(names)).values(
+        version=self.versions.c.version + 1, changed_at=datetime.now()))
+
+  def watch(self, session_class):
+    @event.listens_for(session_class, 'before_flush')
+    def bump_flush(db_session, flush_context, instances):
+      names = set()
+      for instance in list(db_session.new) + list(db_session.dirty):
+        names.update(self.listings_for(instance, False))
+      for instance in db_session.deleted:
+        names.update(self.listings_for(instance, True))
+      if names:
+        self.bump(db_session.connection(), names)
@@ -0,0 +1,111 @@
+#----------------------------------------------------------------------------#
+# View models.
+#
+# Show and detail pages are rendered from these rather than from dicts
+# copied out of ORM instances. Shows are named tuples made straight from
+# result rows, the detail pages are slotted dataclasses, so nothing here
+# carries a per-instance __dict__. Start times stay datetime objects, the
+# `datetime` template filter formats them without re-parsing. The
+# updated_at fields key the template fragment cache.
+#----------------------------------------------------------------------------#
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+
+class ShowTile(NamedTuple):
+  # a show on /shows
+  start_time: datetime
+  venue_id: int
+  venue_name: str
+  venue_image_link: Optional[str]
+  artist_id: int
+  artist_name: str
+  artist_image_link: Optional[str]
+  venue_updated_at: datetime
+  artist_updated_at: datetime
+
+
+class VenueShow(NamedTuple):
+  # a show on a venue's page
+  start_time: datetime
+  artist_id: int
+  artist_name: str
+  artist_image_link: Optional[str]
+  artist_updated_at: datetime
+
+
+class ArtistShow(NamedTuple):
+  # a show on an artist's page
+  start_time: datetime
+  venue_id: int
+  venue_name: str
+  venue_image_link: Optional[str]
+  venue_updated_at: datetime
+
+
+@dataclass(slots=True)
+class VenuePage:
+  id: int
+  name: str
+  city: str
+  state: str
+  address: str
+  phone: Optional[str]
+  image_link: Optional[str]
+  facebook_link: Optional[str]
+  website: Optional[str]
+  seeking_talent: bool
+  seeking_description: Optional[str]
+  updated_at: datetime
+  genres: List[str]
+  past_shows: List[VenueShow]
+  upcoming_shows: List[VenueShow]
+
+  @property
+  def past_shows_count(self):
+    return len(self.past_shows)
+
+  @property
+  def upcoming_shows_count(self):
+    return len(self.upcoming_shows)
+
+
+@dataclass(slots=True)
+class ArtistPage:
+  id: int
+  name: str
+  city: str
+  state: str
+  phone: Optional[str]
+  image_link: Optional[str]
+  facebook_link: Optional[str]
+  website: Optional[str]
+  seeking_venue: bool
+  seeking_description: Optional[str]
+  updated_at: datetime
+  genres: List[str]
+  past_shows: List[ArtistShow]
+  upcoming_shows: List[ArtistShow]
+
+  @property
+  def past_shows_count(self):
+    return len(self.past_shows)
+
+  @property
+  def upcoming_shows_count(self):
+    return len(self.upcoming_shows)
+
+
+def detail_page(page_class, show_class, rows, past_rows, genres):
+  # `rows` are the owner's columns followed by the show columns, one row
+  # per upcoming show in start time order (a single row of NULL show
+  # columns when the owner has none), `past_rows` the show columns of the
+  # past shows; returns None when there are no rows at all
+  if not rows:
+    return None
+  width = len(rows[0]) - len(show_class._fields)
+  upcoming_shows = [show_class._make(row[width:]) for row in rows if row[width] is not None]
+  past_shows = [show_class._make(row) for row in past_rows]
+  return page_class(*rows[0][:width], genres=genres, past_shows=past_shows, upcoming_shows=upcoming_shows)